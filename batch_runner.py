@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+"""
+Batch Runner Module
+Runs many print jobs concurrently in one process, sharing the download pool, image cache and workers
+"""
+
+import os
+import csv
+import time
+import argparse
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from image_processor import ImageProcessor
+from image_encoder import create_encode_pool
+from image_cache import ImageCache
+from memory_budget import MemoryBudget
+from print_job import add_output_arguments, check_output_arguments, create_job, run_automatic_mode
+from print_clock import PrintClock, LayerSchedule
+from utils import parse_size, format_file_size
+
+logger = logging.getLogger(__name__)
+
+
+MANIFEST_COLUMNS = ('print_name', 'data', 'output_folder')
+
+
+class FairScheduler:
+    """
+    Fair Scheduler: worker threads serving per-job task queues round-robin
+    """
+
+    def __init__(self, workers=8):
+        # job key -> deque of (future, fn, args), in round-robin order
+        self._queues = OrderedDict()
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"fetch-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job_key, fn, *args):
+        future = Future()
+        with self._cond:
+            self._queues.setdefault(job_key, deque()).append((future, fn, args))
+            self._cond.notify()
+        return future
+
+    def _next_task(self):
+        with self._cond:
+            while not self._queues and not self._shutdown:
+                self._cond.wait()
+            if not self._queues:
+                return None
+
+            # serve the job at the front, then send it to the back of the line
+            job_key, queue = next(iter(self._queues.items()))
+            task = queue.popleft()
+            if queue:
+                self._queues.move_to_end(job_key)
+            else:
+                del self._queues[job_key]
+            return task
+
+    def _worker(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            future, fn, args = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+    def shutdown(self):
+        """
+        finish queued tasks and stop the workers
+        """
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+class PrefetchingParser:
+    """
+    Prefetching Parser: downloads images of upcoming layers through the shared scheduler
+    """
+
+    def __init__(self, data_parser, scheduler, job_key, lookahead=16):
+        self.data_parser = data_parser
+        self.scheduler = scheduler
+        self.job_key = job_key
+        self.lookahead = max(0, lookahead)
+
+    def get_estimated_total_layers(self):
+        return self.data_parser.get_estimated_total_layers()
+
+    @staticmethod
+    def _prefetch(url):
+        # the bytes only go to the shared cache, so the window holds no images outside the cache budget
+        ImageProcessor.fetch_image_bytes(url)
+
+    def parse(self):
+        window = deque()
+        for layer_data in self.data_parser.parse():
+            url = layer_data.get('image_url')
+            future = self.scheduler.submit(self.job_key, self._prefetch, url) if url else None
+            window.append((layer_data, future))
+            if len(window) > self.lookahead:
+                yield self._wait_ready(*window.popleft())
+        while window:
+            yield self._wait_ready(*window.popleft())
+
+    def _wait_ready(self, layer_data, future):
+        # the downloaded bytes land in the shared cache, process_image picks them up from there
+        if future is not None:
+            try:
+                future.result()
+            except Exception as e:
+                logger.warning(f"prefetch layer {layer_data.get('layer_id')} error: {e}")
+        return layer_data
+
+
+def read_manifest(manifest_path):
+    """
+    read the (print_name, data, output_folder) rows of a batch manifest
+    """
+    jobs = []
+    with open(manifest_path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in MANIFEST_COLUMNS if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"manifest missing columns: {', '.join(missing)}")
+
+        for row_idx, row in enumerate(reader, 1):
+            job = {column: (row.get(column) or '').strip() for column in MANIFEST_COLUMNS}
+            if not all(job.values()):
+                raise ValueError(f"manifest row {row_idx} incomplete: {row}")
+            jobs.append(job)
+    return jobs
+
+
+def run_job(job_key, job, args, scheduler, encode_pool, print_clock=None, memory_budget=None):
+    start_time = time.time()
+    os.makedirs(job['output_folder'], exist_ok=True)
+
+    print_dir, data_parser, output_manager, error_handler, summary_generator = create_job(
+        job['print_name'], job['output_folder'], job['data'], args, encode_pool=encode_pool,
+        memory_budget=memory_budget
+    )
+    parser = PrefetchingParser(data_parser, scheduler, job_key, args.prefetch)
+    layer_schedule = LayerSchedule.from_parser(data_parser, print_clock) if print_clock else None
+
+    logger.info(f"job '{job['print_name']}' start")
+    success = run_automatic_mode(parser, output_manager, error_handler, summary_generator, layer_schedule)
+
+    return {
+        'print_name': job['print_name'],
+        'print_dir': print_dir,
+        'success': success,
+        'layers': output_manager.get_layers_written(),
+        'errors': error_handler.get_error_count(),
+        'elapsed': time.time() - start_time,
+    }
+
+
+def log_batch_summary(results, wall_time, cache):
+    total_layers = sum(r['layers'] for r in results)
+
+    logger.info("===== batch summary =====")
+    for r in results:
+        rate = r['layers'] / r['elapsed'] if r['elapsed'] > 0 else 0
+        status = 'ok' if r['success'] else 'FAIL'
+        logger.info(f"{r['print_name']}: {status}, {r['layers']} layers, {r['errors']} errors, "
+                    f"{r['elapsed']:.2f} s ({rate:.1f} layers/s) -> {r['print_dir']}")
+    if wall_time > 0:
+        logger.info(f"total: {len(results)} jobs, {total_layers} layers in {wall_time:.2f} s "
+                    f"({total_layers / wall_time:.1f} layers/s)")
+    stats = cache.get_stats()
+    logger.info(f"image cache: {stats['hits']} hits, {stats['misses']} misses, "
+                f"{stats['entries']} entries ({format_file_size(stats['bytes'])})")
+
+
+def run_batch(argv=None):
+    """
+    entry point of `main.py batch <manifest>`
+    """
+    parser = argparse.ArgumentParser(prog='main.py batch',
+                                     description='FakePrinter - run many print jobs in one process')
+    parser.add_argument('manifest', type=str,
+                        help='CSV manifest with print_name, data and output_folder columns')
+    parser.add_argument('--max-jobs', type=int, default=4,
+                        help='Number of jobs running at the same time (default: 4)')
+    parser.add_argument('--download-workers', type=int, default=8,
+                        help='Download threads and HTTP connections shared by all jobs (default: 8)')
+    parser.add_argument('--prefetch', type=int, default=16,
+                        help='Layers each job downloads ahead of processing (default: 16)')
+    parser.add_argument('--cache-size', type=parse_size, default=parse_size('256M'),
+                        help='Shared image cache size, e.g. 256M (default: 256M)')
+    add_output_arguments(parser)
+    args = parser.parse_args(argv)
+    check_output_arguments(parser, args)
+
+    try:
+        jobs = read_manifest(args.manifest)
+    except Exception as e:
+        parser.error(f"Cannot read manifest '{args.manifest}': {e}")
+    for job in jobs:
+        if not os.path.exists(job['data']):
+            parser.error(f"Data file '{job['data']}' of job '{job['print_name']}' does not exist")
+
+    cache = ImageCache(args.cache_size)
+    # one budget for the whole process: the jobs' in-flight images share what the cache leaves
+    memory_budget = MemoryBudget(args.max_memory)
+    memory_budget.reserve(cache.max_bytes, 'image cache')
+    ImageProcessor.configure_downloads(pool_size=args.download_workers, cache=cache)
+    scheduler = FairScheduler(args.download_workers)
+    encode_pool = create_encode_pool(args.encode_workers) if args.encode_workers > 0 else None
+    # one timer heap wakes the layers of every job
+    print_clock = PrintClock(args.speed) if args.speed is not None else None
+
+    logger.info(f"batch: {len(jobs)} jobs, {args.max_jobs} at a time")
+    start_time = time.time()
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.max_jobs), thread_name_prefix='job') as executor:
+            futures = [
+                executor.submit(run_job, job_key, job, args, scheduler, encode_pool, print_clock, memory_budget)
+                for job_key, job in enumerate(jobs)
+            ]
+            for job, future in zip(jobs, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    logger.error(f"job '{job['print_name']}' fail: {e}")
+                    results.append({
+                        'print_name': job['print_name'],
+                        'print_dir': os.path.join(job['output_folder'], job['print_name']),
+                        'success': False,
+                        'layers': 0,
+                        'errors': 0,
+                        'elapsed': 0.0,
+                    })
+    finally:
+        if print_clock is not None:
+            print_clock.stop()
+        scheduler.shutdown()
+        if encode_pool is not None:
+            encode_pool.shutdown(wait=True)
+
+    log_batch_summary(results, time.time() - start_time, cache)
+    return 0 if all(r['success'] for r in results) else 1
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+"""
+Compressed IO Module
+gzip / zstd output streams written on a background thread, and matching readers
+"""
+
+import io
+import os
+import gzip
+import queue
+import logging
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+LEVEL_RANGES = {'gzip': (1, 9), 'zstd': (1, 22)}
+
+
+def available_compressions():
+    return [c for c in COMPRESSIONS if c != 'zstd' or zstandard is not None]
+
+
+def compressed_path(path, compression):
+    return path + EXTENSIONS.get(compression, '')
+
+
+def compression_of(path):
+    for compression, extension in EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return 'none'
+
+
+def output_variants(path):
+    return [path] + [path + extension for extension in EXTENSIONS.values()]
+
+
+def find_output(path):
+    """
+    path itself if it exists, else its first existing compressed variant, else path
+    """
+    for candidate in output_variants(path):
+        if os.path.exists(candidate):
+            return candidate
+    return path
+
+
+def remove_other_variants(path, compression):
+    """
+    delete the plain / compressed variants of path left by an earlier run in another format,
+    readers would otherwise pick them up instead of the current output
+    """
+    current = compressed_path(path, compression)
+    for candidate in output_variants(path):
+        if candidate != current and os.path.exists(candidate):
+            logger.info(f"remove stale output {candidate}")
+            os.remove(candidate)
+
+
+def open_binary(path):
+    """
+    binary reader of a plain, .gz or .zst file
+    """
+    compression = compression_of(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError(f"zstandard is required to read {path}")
+        return io.BufferedReader(zstandard.open(path, 'rb'))
+    return open(path, 'rb')
+
+
+def open_text(path, encoding='utf-8', newline=None):
+    """
+    text reader of a plain, .gz or .zst file
+    """
+    if compression_of(path) == 'none':
+        return open(path, 'r', encoding=encoding, newline=newline)
+    return io.TextIOWrapper(open_binary(path), encoding=encoding, newline=newline)
+
+
+def _open_compressed_output(path, compression, level):
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=level)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("zstandard is not installed, zstd output is unavailable")
+        return zstandard.open(path, 'wb', cctx=zstandard.ZstdCompressor(level=level))
+    raise ValueError(f"unknown compression: {compression}")
+
+
+class CompressedStreamWriter:
+    """
+    Compressed Stream Writer: text sink whose compression and disk writes run on a background thread
+    """
+
+    def __init__(self, path, compression='gzip', level=None, chunk_size=64 * 1024, max_chunks=64):
+        self.path = path
+        self.compression = compression
+        level = DEFAULT_LEVELS[compression] if level is None else level
+        self._file = _open_compressed_output(path, compression, level)
+
+        self.chunk_size = chunk_size
+        self._buffer = []
+        self._buffered = 0
+        self.bytes_in = 0
+
+        # bounded, a slow disk holds the producer back instead of growing memory
+        self._queue = queue.Queue(maxsize=max_chunks)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"compress-{os.path.basename(path)}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                break
+            if self._error is None:
+                try:
+                    self._file.write(chunk)
+                except Exception as e:
+                    self._error = e
+        try:
+            self._file.close()
+        except Exception as e:
+            self._error = self._error or e
+
+    def _check_error(self):
+        if self._error is not None:
+            raise IOError(f"write {self.path} error: {self._error}")
+
+    def _submit(self):
+        self._check_error()
+        if self._buffer:
+            self._queue.put(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self.bytes_in += len(data)
+        if self._buffered >= self.chunk_size:
+            self._submit()
+        return len(text)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._submit()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+        self._check_error()
+
+    def get_stats(self):
+        written = os.path.getsize(self.path) if self._closed and os.path.exists(self.path) else 0
+        return {'file': os.path.basename(self.path), 'bytes_in': self.bytes_in, 'bytes_written': written}
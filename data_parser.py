@@ -11,6 +11,8 @@ import os
 import requests
 from io import BytesIO
 
+from compressed_io import open_text
+
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +28,7 @@ class DataParser:
             raise FileNotFoundError(f"cannot find: {csv_file_path}")
         
         try:
-            with open(csv_file_path, 'r', encoding='utf-8', newline='') as f:
+            with open_text(csv_file_path, encoding='utf-8', newline='') as f:
                 reader = csv.reader(f)
                 self.headers = next(reader)
                 logger.info(f"file header: {self.headers}")
@@ -35,7 +37,7 @@ class DataParser:
             
     def _count_lines(self):
         try:
-            with open(self.csv_file_path, 'r', encoding='utf-8') as f:
+            with open_text(self.csv_file_path, encoding='utf-8') as f:
                 return sum(1 for _ in f) - 1 
         except Exception as e:
             return -1
@@ -43,9 +45,24 @@ class DataParser:
     def get_estimated_total_layers(self):
         return self.total_lines
         
+    def iter_column(self, field_key):
+        """
+        values of one column (by parsed field key, e.g. 'layer_time') without building layer dicts
+        """
+        keys = [field_name.lower().replace(' ', '_') for field_name in self.headers]
+        if field_key not in keys:
+            return
+        column = keys.index(field_key)
+        
+        with open_text(self.csv_file_path, encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            next(reader)
+            for row in reader:
+                yield row[column] if column < len(row) else ''
+        
     def parse(self):
         try:
-            with open(self.csv_file_path, 'r', encoding='utf-8', newline='') as f:
+            with open_text(self.csv_file_path, encoding='utf-8', newline='') as f:
                 reader = csv.reader(f)
                 next(reader)  
                 
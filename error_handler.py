@@ -5,38 +5,153 @@ error_handler.py
 """
 
 import os
+import csv
 import json
+import time
 import logging
+from collections import Counter
 from datetime import datetime
 
+from output_layout import IMAGE_BATCH_SIZE, batch_num, batch_name
+
 logger = logging.getLogger(__name__)
 
 
+ERROR_LOG_COLUMNS = ['layer_id', 'error_type', 'error_message', 'action', 'timestamp']
+
+# errors are grouped by the same batches as the image folders
+ERROR_BATCH_SIZE = IMAGE_BATCH_SIZE
+# consecutive-failure runs kept in memory, later runs are only counted
+MAX_ERROR_RUNS = 10000
+# console warnings per error type in automatic mode before only every 1000th is shown
+WARNINGS_PER_TYPE = 10
+
+
+class ErrorAggregator:
+    """
+    Error Aggregator: error totals by type, by layer batch and runs of consecutive failures
+    """
+
+    def __init__(self):
+        self.entries = 0
+        self.by_type = Counter()
+        self.by_batch = Counter()
+        # [first layer, last layer, error type, entries]
+        self.runs = []
+        self.dropped_runs = 0
+
+    def add(self, layer_id, error_type):
+        self.entries += 1
+        self.by_type[error_type] += 1
+
+        layer_num = int(layer_id) if str(layer_id).isdigit() else None
+        if layer_num is None:
+            return
+        self.by_batch[batch_num(layer_num, ERROR_BATCH_SIZE)] += 1
+
+        # run-length grouping
+        last = self.runs[-1] if self.runs else None
+        if last and last[2] == error_type and last[1] <= layer_num <= last[1] + 1:
+            last[1] = layer_num
+            last[3] += 1
+        elif len(self.runs) < MAX_ERROR_RUNS:
+            self.runs.append([layer_num, layer_num, error_type, 1])
+        else:
+            self.dropped_runs += 1
+
+    def get_stats(self, total=None, top=10):
+        longest_runs = sorted(self.runs, key=lambda run: run[3], reverse=True)[:top]
+        return {
+            'total': self.entries if total is None else total,
+            'by_type': dict(self.by_type.most_common()),
+            'by_batch': {
+                batch_name(batch, ERROR_BATCH_SIZE): count
+                for batch, count in self.by_batch.most_common(top)
+            },
+            'longest_runs': [
+                {'first_layer': r[0], 'last_layer': r[1], 'error_type': r[2], 'count': r[3]}
+                for r in longest_runs
+            ],
+            'run_count': len(self.runs) + self.dropped_runs,
+        }
+
+    def to_dict(self):
+        return {
+            'entries': self.entries,
+            'by_type': dict(self.by_type),
+            'by_batch': {str(batch): count for batch, count in self.by_batch.items()},
+            'runs': self.runs,
+            'dropped_runs': self.dropped_runs,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregator = cls()
+        aggregator.entries = data['entries']
+        aggregator.by_type = Counter(data['by_type'])
+        aggregator.by_batch = Counter({int(batch): count for batch, count in data['by_batch'].items()})
+        aggregator.runs = data['runs']
+        aggregator.dropped_runs = data['dropped_runs']
+        return aggregator
+
+
 class ErrorHandler:
-    def __init__(self, error_log_path):
+    def __init__(self, error_log_path, flush_every=1000, flush_interval=1.0):
         self.error_log_path = error_log_path
         self.error_count = 0
-        
+
+        # entries are buffered and written in batches
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._file = None
+        self._writer = None
+
+        # aggregates for the summary
+        self.aggregates = ErrorAggregator()
+
         self._init_error_log()
-        
+
     def _init_error_log(self):
         try:
-            with open(self.error_log_path, 'w', encoding='utf-8') as f:
-                f.write(f"# FakePrinter error log\n")
-                f.write(f"# time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-                f.write("layer id,error type, error description,reslut\n")
-                f.write("-" * 80 + "\n")
+            self._file = open(self.error_log_path, 'w', encoding='utf-8', newline='')
+            self._file.write(f"# FakePrinter error log\n")
+            self._file.write(f"# time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(ERROR_LOG_COLUMNS)
+            self._file.flush()
         except Exception as e:
             logger.error(f"init log error: {e}")
-            
+
     def log_error(self, layer_id, error_type, error_message, action):
-        try:
-            with open(self.error_log_path, 'a', encoding='utf-8') as f:
-                timestamp = datetime.now().strftime('%H:%M:%S')
-                f.write(f"{layer_id},{error_type},{error_message},{action},{timestamp}\n")
-        except Exception as e:
-            logger.error(f"write log error: {e}")
-            
+        timestamp = datetime.now().strftime('%H:%M:%S')
+        # one entry per line keeps the log readable line by line
+        message = str(error_message).replace('\r', ' ').replace('\n', ' ')
+        self._pending.append([layer_id, error_type, message, action, timestamp])
+        self.aggregates.add(layer_id, error_type)
+
+        if len(self._pending) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        write buffered entries to the error log
+        """
+        if self._pending and self._writer is not None:
+            try:
+                self._writer.writerows(self._pending)
+                self._file.flush()
+            except Exception as e:
+                logger.error(f"write log error: {e}")
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
     def handle_error(self, error_message, layer_data, automatic=False):
         self.error_count += 1
         layer_id = layer_data.get('layer_id', 'unknown')
@@ -50,10 +165,15 @@ class ErrorHandler:
             error_type = 'no image data'
         else:
             error_type = 'image process fail'
-            
+
         if automatic:
-            logger.warning(f"[auto mode] {error_message}")
             self.log_error(layer_id, error_type, error_message, 'ignored')
+            # error storms would otherwise flood the console
+            seen = self.aggregates.by_type[error_type]
+            if seen <= WARNINGS_PER_TYPE:
+                logger.warning(f"[auto mode] {error_message}")
+            elif seen % 1000 == 0:
+                logger.warning(f"[auto mode] {seen} '{error_type}' errors so far")
             return 'ignore'
         else:
             print(f"\error: {error_message}")
@@ -61,7 +181,7 @@ class ErrorHandler:
             print("\nmode:")
             print("  [I] ignore and skip")
             print("  [E] end print")
-            
+
             while True:
                 choice = input("\nplease input [I/E]: ").strip().lower()
                 if choice == 'i':
@@ -69,9 +189,16 @@ class ErrorHandler:
                     return 'ignore'
                 elif choice == 'e':
                     self.log_error(layer_id, error_type, error_message, 'terminated')
+                    self.flush()
                     return 'end'
                 else:
                     print("please re-input")
-                    
+
     def get_error_count(self):
         return self.error_count
+
+    def get_error_stats(self, top=10):
+        """
+        error totals by type, by layer batch and the longest runs of consecutive failures
+        """
+        return self.aggregates.get_stats(total=self.error_count, top=top)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+"""
+Image Deduplicator Module
+Stores each unique layer image once and records duplicates as hardlinks or references
+"""
+
+import os
+import hashlib
+import logging
+from collections import OrderedDict, deque
+
+from image_processor import ImageProcessor
+
+logger = logging.getLogger(__name__)
+
+
+DEDUP_MODES = ('off', 'hardlink', 'reference')
+
+# max difference of mean brightness (0-255) between near duplicates
+MAX_BRIGHTNESS_DELTA = 4
+# unique images remembered for exact matching, about 10 MB of keys and paths;
+# a duplicate of an image evicted since is written again as a new copy
+MAX_BLOBS = 100000
+
+
+def replace_with_link(source_path, link_path):
+    if os.path.lexists(link_path):
+        os.remove(link_path)
+    os.link(source_path, link_path)
+
+
+class ImageDeduplicator:
+    """
+    Image Deduplicator: content-hash based dedup of layer images
+    """
+
+    def __init__(self, mode='hardlink', perceptual=False, max_distance=0, window=64, writer=None,
+                 linker=None, max_blobs=MAX_BLOBS):
+        if mode not in DEDUP_MODES:
+            raise ValueError(f"unknown dedup mode: {mode}")
+
+        self.mode = mode
+        self.perceptual = perceptual
+        self.max_distance = max_distance
+        # writer(data, path) -> bool of unique images
+        self.writer = writer or ImageProcessor.write_image_bytes
+        # linker(source, path) creating a hardlink of duplicates, raises OSError on failure
+        self.linker = linker or replace_with_link
+
+        # truncated content digest -> canonical path, least recently matched evicted first
+        self._blobs = OrderedDict()
+        self.max_blobs = max_blobs
+        # recent (perceptual hash, canonical path), neighbouring layers are the likely matches
+        self._recent = deque(maxlen=window)
+
+        self.total_images = 0
+        self.unique_images = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self.bytes_written = 0
+        self.bytes_saved = 0
+        self.link_fallbacks = 0
+
+    @staticmethod
+    def perceptual_hash(image, hash_size=8):
+        """
+        difference hash (dHash) of an image and its mean brightness, as an (int, int) tuple
+        """
+        small = image.convert('L').resize((hash_size + 1, hash_size))
+        pixels = list(small.getdata())
+        value = 0
+        for row in range(hash_size):
+            offset = row * (hash_size + 1)
+            for col in range(hash_size):
+                value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+        # dHash only sees gradients, flat images of different shades would all match
+        return value, sum(pixels) // len(pixels)
+
+    def _find_near_duplicate(self, phash):
+        value, brightness = phash
+        for (known_value, known_brightness), known_path in self._recent:
+            if (abs(known_brightness - brightness) <= MAX_BRIGHTNESS_DELTA
+                    and bin(known_value ^ value).count('1') <= self.max_distance):
+                return known_path
+        return None
+
+    def _record_duplicate(self, canonical_path, image_path, data):
+        if self.mode == 'hardlink' and canonical_path != image_path:
+            try:
+                self.linker(canonical_path, image_path)
+            except OSError as e:
+                # the caller may already have recorded image_path, so it has to exist
+                logger.debug(f"hardlink fail, write a copy: {e}")
+                self.link_fallbacks += 1
+                if not self.writer(data, image_path):
+                    return None
+                self.bytes_written += len(data)
+                return image_path
+        self.bytes_saved += len(data)
+        return image_path if self.mode == 'hardlink' else canonical_path
+
+    def store(self, data, image_path, phash=None):
+        """
+        write encoded image once per unique content, return the path to record for the layer
+        """
+        if data is None:
+            return None
+
+        self.total_images += 1
+        # 128 bits keep collisions out of reach at half the key memory
+        digest = hashlib.sha256(data).digest()[:16]
+
+        canonical_path = self._blobs.get(digest)
+        if canonical_path is not None:
+            self._blobs.move_to_end(digest)
+            self.exact_duplicates += 1
+            return self._record_duplicate(canonical_path, image_path, data)
+
+        if self.perceptual and phash is not None:
+            canonical_path = self._find_near_duplicate(phash)
+            if canonical_path is not None:
+                self.near_duplicates += 1
+                return self._record_duplicate(canonical_path, image_path, data)
+
+        if not self.writer(data, image_path):
+            return None
+
+        self._blobs[digest] = image_path
+        if len(self._blobs) > self.max_blobs:
+            self._blobs.popitem(last=False)
+        if phash is not None:
+            self._recent.append((phash, image_path))
+        self.unique_images += 1
+        self.bytes_written += len(data)
+        return image_path
+
+    def get_stats(self):
+        duplicates = self.exact_duplicates + self.near_duplicates
+        return {
+            'mode': self.mode,
+            'perceptual': self.perceptual,
+            'total_images': self.total_images,
+            'unique_images': self.unique_images,
+            'exact_duplicates': self.exact_duplicates,
+            'near_duplicates': self.near_duplicates,
+            'dedup_ratio': (self.total_images / self.unique_images) if self.unique_images else 1.0,
+            'duplicate_rate': (duplicates / self.total_images) if self.total_images else 0.0,
+            'bytes_written': self.bytes_written,
+            'bytes_saved': self.bytes_saved,
+            'link_fallbacks': self.link_fallbacks,
+        }
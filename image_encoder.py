@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""
+Image Encoder Module
+Configurable output encoding of layer images, optionally on a process pool
+"""
+
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from image_processor import ImageProcessor
+from image_deduplicator import ImageDeduplicator
+
+logger = logging.getLogger(__name__)
+
+
+ENCODE_FORMATS = ('png', 'webp')
+
+# workers start from a clean interpreter: a forked child would inherit locks held by the
+# compression, clock, scheduler and job threads at fork time and could deadlock on them
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def build_save_options(image_format, compress_level=6, optimize=False):
+    """
+    PIL save() keyword arguments for an output format
+    """
+    if image_format == 'png':
+        return {'compress_level': compress_level, 'optimize': optimize}
+    if image_format == 'webp':
+        # lossless WebP, method is the effort level (0 fast .. 6 smallest)
+        return {'lossless': True, 'method': 6 if optimize else min(compress_level, 6)}
+    raise ValueError(f"unknown image format: {image_format}")
+
+
+def create_encode_pool(workers):
+    """
+    process pool for encode_image_job, started without fork
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+
+
+def encode_image_job(image, image_format, save_options, thumbnail_size=None, perceptual=False):
+    """
+    encode one image (and its thumbnail), runs inside a worker process
+    """
+    result = {'data': None, 'thumbnail': None, 'phash': None, 'timings': {}}
+
+    start = time.perf_counter()
+    result['data'] = ImageProcessor.encode_image(image, image_format, **save_options)
+    result['timings'][image_format] = time.perf_counter() - start
+
+    if thumbnail_size:
+        start = time.perf_counter()
+        thumb = image.copy()
+        thumb.thumbnail((thumbnail_size, thumbnail_size))
+        result['thumbnail'] = ImageProcessor.encode_image(thumb, image_format, **save_options)
+        result['timings'][f"{image_format}_thumbnail"] = time.perf_counter() - start
+
+    if perceptual:
+        result['phash'] = ImageDeduplicator.perceptual_hash(image)
+
+    return result
+
+
+class ImageEncoder:
+    """
+    Image Encoder: encodes images with the configured format and level
+    """
+
+    def __init__(self, image_format='png', compress_level=6, optimize=False,
+                 thumbnail_size=None, workers=0, perceptual=False, pool=None):
+        if image_format not in ENCODE_FORMATS:
+            raise ValueError(f"unknown image format: {image_format}")
+
+        self.image_format = image_format
+        self.save_options = build_save_options(image_format, compress_level, optimize)
+        self.thumbnail_size = thumbnail_size
+        self.perceptual = perceptual
+        self.workers = workers
+
+        # a pool passed in is shared with other jobs and left running on close
+        self._owns_pool = pool is None
+        if pool is None and workers > 0:
+            pool = create_encode_pool(workers)
+        self._pool = pool
+
+        # format -> count / bytes / seconds spent encoding
+        self._stats = {}
+
+    @property
+    def extension(self):
+        return f".{self.image_format}"
+
+    def output_filename(self, image_filename):
+        """
+        file name with the extension of the output format
+        """
+        return os.path.splitext(image_filename)[0] + self.extension
+
+    def submit(self, image):
+        """
+        encode an image, returns a future resolving to the encode result
+        """
+        args = (image, self.image_format, self.save_options, self.thumbnail_size, self.perceptual)
+        if self._pool is not None:
+            return self._pool.submit(encode_image_job, *args)
+
+        future = Future()
+        try:
+            future.set_result(encode_image_job(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def record(self, result):
+        """
+        add an encode result to the per format statistics
+        """
+        sizes = {self.image_format: result['data'], f"{self.image_format}_thumbnail": result['thumbnail']}
+        for fmt, seconds in result['timings'].items():
+            entry = self._stats.setdefault(fmt, {'count': 0, 'bytes': 0, 'seconds': 0.0})
+            entry['count'] += 1
+            entry['bytes'] += len(sizes.get(fmt) or b'')
+            entry['seconds'] += seconds
+
+    def get_stats(self):
+        return {
+            'workers': self.workers,
+            'options': dict(self.save_options),
+            'formats': {fmt: dict(entry) for fmt, entry in self._stats.items()},
+        }
+
+    def close(self):
+        if self._pool is not None and self._owns_pool:
+            self._pool.shutdown(wait=True)
+        self._pool = None
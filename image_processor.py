@@ -17,6 +17,22 @@ logger = logging.getLogger(__name__)
 
 class ImageProcessor:
     
+    # shared by every job in the process, see configure_downloads
+    _session = None
+    _cache = None
+    
+    @classmethod
+    def configure_downloads(cls, pool_size=10, cache=None):
+        """
+        reuse one HTTP connection pool (and optionally an image cache) for all downloads
+        """
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        cls._session = session
+        cls._cache = cache
+    
     @staticmethod
     def decode_image(image_data, image_format='png'):
         if not image_data:
@@ -31,18 +47,26 @@ class ImageProcessor:
             return None
             
     @staticmethod
-    def download_image(url, max_retries=3, retry_delay=1):
+    def fetch_image_bytes(url, max_retries=3, retry_delay=1):
         if not url:
             return None
         
+        cache = ImageProcessor._cache
+        if cache is not None:
+            content = cache.get(url)
+            if content is not None:
+                return content
+        
+        http = ImageProcessor._session or requests
         for attempt in range(max_retries):
             try:
-                response = requests.get(url, timeout=10)
+                response = http.get(url, timeout=10)
                 response.raise_for_status()  
                 
-                image = Image.open(BytesIO(response.content))
                 logger.info(f"download success: {url}")
-                return image
+                if cache is not None:
+                    cache.put(url, response.content)
+                return response.content
                 
             except requests.exceptions.RequestException as e:
                 logger.warning(f"download error (try {attempt+1}/{max_retries}): {e}")
@@ -51,9 +75,18 @@ class ImageProcessor:
                 else:
                     logger.error(f"downlaod fail: {url}")
                     return None
-            except Exception as e:
-                logger.error(f"prcess fail: {e}")
-                return None
+    
+    @staticmethod
+    def download_image(url, max_retries=3, retry_delay=1):
+        content = ImageProcessor.fetch_image_bytes(url, max_retries, retry_delay)
+        if content is None:
+            return None
+        
+        try:
+            return Image.open(BytesIO(content))
+        except Exception as e:
+            logger.error(f"prcess fail: {e}")
+            return None
     
     @staticmethod
     def save_image(image, output_path, image_format='png'):
@@ -70,6 +103,40 @@ class ImageProcessor:
             logger.error(f"image save error: {e}")
             return False
     
+    @staticmethod
+    def encode_image(image, image_format='png', **save_options):
+        if image is None:
+            return None
+            
+        try:
+            buffer = BytesIO()
+            image.save(buffer, format=image_format, **save_options)
+            return buffer.getvalue()
+        except Exception as e:
+            logger.error(f"image encode error: {e}")
+            return None
+    
+    @staticmethod
+    def write_image_bytes(data, output_path):
+        if data is None:
+            return False
+            
+        try:
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            
+            # replace the entry instead of truncating it, it may be a hardlink shared with other layers
+            try:
+                os.remove(output_path)
+            except FileNotFoundError:
+                pass
+            with open(output_path, 'xb') as f:
+                f.write(data)
+            logger.debug(f"image save as: {output_path}")
+            return True
+        except Exception as e:
+            logger.error(f"image save error: {e}")
+            return False
+    
     @staticmethod
     def process_layer_image(layer_data, output_dir, layer_id):
         image_data = None
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+"""
+Layer Index Module
+On-disk index over a finished print's layers.csv and error.log for fast layer queries
+"""
+
+import io
+import os
+import csv
+import sys
+import sqlite3
+import argparse
+import logging
+
+from utils import file_signature, iter_csv_rows
+from compressed_io import find_output
+
+logger = logging.getLogger(__name__)
+
+
+INDEX_FILENAME = 'layers_index.db'
+INDEX_VERSION = '2'
+INSERT_BATCH = 10000
+
+
+class LayerIndex:
+    """
+    Layer Index: layer_id -> layers.csv byte offset, image file, status and error types
+    """
+
+    def __init__(self, print_dir):
+        self.print_dir = print_dir
+        self.layers_csv_path = os.path.join(print_dir, 'layers.csv')
+        self.error_log_path = os.path.join(print_dir, 'error.log')
+        self.index_path = os.path.join(print_dir, INDEX_FILENAME)
+
+        self.conn = sqlite3.connect(self.index_path)
+        # the index can always be rebuilt from the outputs, no need to fsync it
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.header = None
+        self._create_tables()
+
+    def _create_tables(self):
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS layers (
+                layer_num INTEGER,
+                layer_id TEXT,
+                offset INTEGER,
+                length INTEGER,
+                status TEXT,
+                image_file TEXT
+            );
+            CREATE TABLE IF NOT EXISTS errors (layer_id TEXT, error_type TEXT);
+            CREATE INDEX IF NOT EXISTS layers_num ON layers (layer_num);
+            CREATE INDEX IF NOT EXISTS layers_id ON layers (layer_id);
+            CREATE INDEX IF NOT EXISTS layers_status ON layers (status, layer_num);
+            CREATE INDEX IF NOT EXISTS errors_type ON errors (error_type, layer_id);
+            CREATE INDEX IF NOT EXISTS errors_id ON errors (layer_id, error_type);
+        """)
+
+    def _meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, **values):
+        self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                              [(k, str(v)) for k, v in values.items()])
+
+    def _checkpoint(self, prefix, path):
+        """
+        byte offset indexed so far, 0 when the file was rewritten since
+        """
+        offset = int(self._meta(f"{prefix}_offset", 0))
+        valid = (self._meta('version') == INDEX_VERSION and os.path.exists(path)
+                 and os.path.getsize(path) >= offset
+                 and file_signature(path, offset) == self._meta(f"{prefix}_signature", ''))
+        return offset if valid else 0
+
+    @staticmethod
+    def _complete_lines(f, offset):
+        """
+        (start offset, line) of every newline-terminated line from offset on
+        """
+        f.seek(offset)
+        for raw in iter(f.readline, b''):
+            if not raw.endswith(b'\n'):
+                return
+            yield offset, raw
+            offset += len(raw)
+
+    def _update_layers(self):
+        if not os.path.exists(self.layers_csv_path):
+            compressed = find_output(self.layers_csv_path)
+            if compressed != self.layers_csv_path:
+                # byte offsets are only seekable in the plain file
+                raise ValueError(f"query needs an uncompressed layers.csv, decompress {compressed} first")
+            raise FileNotFoundError(f"cannot find: {self.layers_csv_path}")
+
+        offset = self._checkpoint('layers', self.layers_csv_path)
+        if offset == 0:
+            self.conn.execute("DELETE FROM layers")
+
+        with open(self.layers_csv_path, 'rb') as f:
+            header_line = f.readline()
+            self.header = next(csv.reader([header_line.decode('utf-8')]))
+            columns = {name: i for i, name in enumerate(self.header)}
+            id_col, status_col, image_col = columns['layer_id'], columns['status'], columns['image_file']
+
+            rows = []
+            end = max(offset, len(header_line))
+            f.seek(end)
+            # quoted fields may span lines, so rows are cut by the csv reader, not at newlines
+            for row, start, end in iter_csv_rows(f, end):
+                if not row:
+                    continue
+                layer_id = row[id_col]
+                rows.append((
+                    int(layer_id) if layer_id.isdigit() else None,
+                    layer_id,
+                    start,
+                    end - start,
+                    row[status_col] if status_col < len(row) else '',
+                    row[image_col] if image_col < len(row) else '',
+                ))
+                if len(rows) >= INSERT_BATCH:
+                    self.conn.executemany("INSERT INTO layers VALUES (?, ?, ?, ?, ?, ?)", rows)
+                    rows = []
+            if rows:
+                self.conn.executemany("INSERT INTO layers VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+        if end > offset:
+            logger.info(f"indexed layers.csv up to byte {end}")
+        self._set_meta(layers_offset=end, layers_signature=file_signature(self.layers_csv_path, end))
+
+    def _update_errors(self):
+        if not os.path.exists(self.error_log_path):
+            return
+
+        offset = self._checkpoint('errors', self.error_log_path)
+        if offset == 0:
+            self.conn.execute("DELETE FROM errors")
+
+        end = offset
+        rows = []
+        with open(self.error_log_path, 'rb') as f:
+            for start, raw in self._complete_lines(f, offset):
+                end = start + len(raw)
+                line = raw.decode('utf-8', errors='replace').strip()
+                # skip the comment header and column names (and the separator of older logs)
+                if not line or line.startswith(('#', '-', 'layer id', 'layer_id,')):
+                    continue
+                # older logs did not escape messages, the leading layer id and error type parse either way
+                fields = next(csv.reader([line]), [])
+                if len(fields) >= 2:
+                    rows.append((fields[0], fields[1]))
+        if rows:
+            self.conn.executemany("INSERT INTO errors VALUES (?, ?)", rows)
+        self._set_meta(errors_offset=end, errors_signature=file_signature(self.error_log_path, end))
+
+    def update(self):
+        """
+        build the index on first use, afterwards only index what was appended
+        """
+        with self.conn:
+            self._update_layers()
+            self._update_errors()
+            self._set_meta(version=INDEX_VERSION)
+
+    def query(self, layer_id=None, start=None, end=None, status=None, error_type=None, limit=None):
+        """
+        matching (layer_id, offset, length, status, image_file) rows in layer order
+        """
+        clauses, params = [], []
+        if layer_id is not None:
+            layer_id = str(layer_id)
+            # numeric ids go through the layer_num index
+            clauses.append("layer_num = ?" if layer_id.isdigit() else "layer_id = ?")
+            params.append(int(layer_id) if layer_id.isdigit() else layer_id)
+        if start is not None:
+            clauses.append("layer_num >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("layer_num <= ?")
+            params.append(end)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        sql = "SELECT layer_id, offset, length, status, image_file, layer_num FROM layers"
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        if error_type is None:
+            sql += where
+        else:
+            # one indexed lookup per source instead of an OR the planner cannot use an index for;
+            # a narrowed scan probes errors per layer, an open one walks the error type's entries
+            and_where = where + (" AND " if where else " WHERE ")
+            if clauses:
+                logged = ("EXISTS (SELECT 1 FROM errors WHERE errors.layer_id = layers.layer_id "
+                          "AND errors.error_type = ?)")
+            else:
+                logged = "layer_id IN (SELECT layer_id FROM errors WHERE error_type = ?)"
+            sql = f"{sql}{and_where}status = ? UNION {sql}{and_where}{logged}"
+            params = params + [error_type] + params + [error_type]
+        sql += " ORDER BY layer_num, offset"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [row[:5] for row in self.conn.execute(sql, params)]
+
+    def error_types(self, layer_id):
+        return [r[0] for r in self.conn.execute("SELECT error_type FROM errors WHERE layer_id = ?",
+                                                (str(layer_id),))]
+
+    def read_rows(self, matches):
+        """
+        full layers.csv rows of query matches, read by byte offset
+        """
+        with open(self.layers_csv_path, 'rb') as f:
+            for layer_id, offset, length, status, image_file in matches:
+                f.seek(offset)
+                yield next(csv.reader(io.StringIO(f.read(length).decode('utf-8'), newline='')))
+
+    def close(self):
+        self.conn.close()
+
+
+def parse_layer_range(text):
+    """
+    '120000-120050' -> (120000, 120050), '120000' -> (120000, 120000)
+    """
+    first, _, last = text.partition('-')
+    return int(first), int(last or first)
+
+
+def run_query(argv=None):
+    """
+    entry point of `main.py query <print_dir>`
+    """
+    parser = argparse.ArgumentParser(prog='main.py query',
+                                     description='FakePrinter - query the layers of a finished print')
+    parser.add_argument('print_dir', type=str, help='Print output directory (<output_folder>/<print_name>)')
+    parser.add_argument('--layer', type=str, default=None, help='Single layer id')
+    parser.add_argument('--range', type=parse_layer_range, default=None, dest='layer_range',
+                        help='Layer range, e.g. 120000-120050')
+    parser.add_argument('--status', type=str, default=None, help='Only layers with this status')
+    parser.add_argument('--error-type', type=str, default=None,
+                        help='Only layers with this error type in layers.csv or error.log')
+    parser.add_argument('--limit', type=int, default=None, help='Maximum number of layers to list')
+    parser.add_argument('--rebuild-index', action='store_true', help='Drop the index and build it again')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.print_dir):
+        parser.error(f"Print directory '{args.print_dir}' does not exist")
+    if args.rebuild_index and os.path.exists(os.path.join(args.print_dir, INDEX_FILENAME)):
+        os.remove(os.path.join(args.print_dir, INDEX_FILENAME))
+
+    index = LayerIndex(args.print_dir)
+    try:
+        index.update()
+        start, end = args.layer_range if args.layer_range else (None, None)
+        matches = index.query(layer_id=args.layer, start=start, end=end, status=args.status,
+                              error_type=args.error_type, limit=args.limit)
+
+        writer = csv.writer(sys.stdout)
+        writer.writerow(index.header + ['image_path', 'logged_errors'])
+        for match, row in zip(matches, index.read_rows(matches)):
+            image_file = match[4]
+            image_path = os.path.join(args.print_dir, image_file) if image_file else ''
+            writer.writerow(row + [image_path, ';'.join(index.error_types(match[0]))])
+        logger.info(f"{len(matches)} layers matched")
+    except Exception as e:
+        logger.error(f"query error: {e}")
+        return 1
+    finally:
+        index.close()
+    return 0
@@ -3,18 +3,12 @@
 FakePrinter - A simulator for 3D printing processes
 """
 
-import os
 import argparse
 import logging
 import sys
-import time
 from pathlib import Path
 
-from data_parser import DataParser
-from image_processor import ImageProcessor
-from output_manager import OutputManager
-from error_handler import ErrorHandler
-from summary_generator import SummaryGenerator
+from utils import format_file_size, format_time
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,6 +19,8 @@ logger = logging.getLogger(__name__)
 
 def parse_arguments():
     """Parse command line arguments"""
+    from print_job import add_output_arguments, check_output_arguments
+
     parser = argparse.ArgumentParser(description='FakePrinter - 3D Print Simulator')
     parser.add_argument('print_name', type=str, help='Print job name')
     parser.add_argument('output_folder', type=str, help='Output folder path')
@@ -33,8 +29,10 @@ def parse_arguments():
                         help='Run mode: supervised (user confirmation) or automatic')    
     parser.add_argument('--data', type=str, default='fl_coding_challenge_v1.csv',
                         help='Path to the print data CSV file (default: fl_coding_challenge_v1.csv)')
+    add_output_arguments(parser)
     
     args = parser.parse_args()
+    check_output_arguments(parser, args)
     
     try:
         output_dir = Path(args.output_folder)
@@ -53,145 +51,22 @@ def parse_arguments():
     return args
 
 
-def run_supervised_mode(data_parser, output_manager, error_handler, summary_generator):
-    """
-    Run in supervised mode - wait for user to press Enter to process each layer
-    """
-    logger.info("Running in supervised mode. Press Enter to process next layer, 'q' to quit")
-    
-    total_height = 0
-    processed_layers = 0
-    error_count = 0
-    
-    # start
-    start_time = time.time()
-    try:        # Process layer by layer
-        for layer_data in data_parser.parse():
-            # wait for user input
-            user_input = input(f"\nReady to process layer {layer_data.get('layer_id', processed_layers + 1)}. Press Enter to continue, 'q' to quit: ")
-            if user_input.lower() == 'q':
-                logger.info("User manually terminated processing")
-                break
-            try:
-                has_predefined_error = False
-                if 'layer_error' in layer_data and layer_data['layer_error'] != 'SUCCESS':
-                    has_predefined_error = True
-                    error_msg = f"layer {layer_data.get('layer_id')} error: {layer_data['layer_error']}"
-                    choice = error_handler.handle_error(error_msg, layer_data)
-                    if choice == 'end':
-                        logger.info("stop")
-                        break
-
-                image_path = None
-                if ('image_data' in layer_data and layer_data['image_data']) or ('image_url' in layer_data and layer_data['image_url']):
-                    image_path = output_manager.process_image(layer_data)
-                
-                output_manager.output_layer(layer_data, image_path)
-                
-                if 'height' in layer_data:
-                    total_height += float(layer_data['height'])
-                elif 'layer_height' in layer_data:
-                    total_height += float(layer_data['layer_height'])
-                    
-                processed_layers += 1
-                logger.info(f" {layer_data.get('layer_id', processed_layers)} finish")
-                
-                if has_predefined_error:
-                    error_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                # ask user, continue or not
-                choice = error_handler.handle_error(
-                    f"layer {layer_data.get('layer_id', processed_layers + 1)} error: {str(e)}",
-                    layer_data
-                )
-                
-                if choice == 'end':
-                    logger.info("end print")
-                    break
-    except Exception as e:
-        logger.error(f"error: {e}")
-        return False
-        
-    elapsed_time = time.time() - start_time
-    
-    summary_generator.generate(
-        processed_layers=processed_layers, 
-        total_height=total_height,
-        error_count=error_count,
-        elapsed_time=elapsed_time,
-        terminated_early=(processed_layers < data_parser.get_estimated_total_layers())
-    )
-    
-    return True
-
-
-def run_automatic_mode(data_parser, output_manager, error_handler, summary_generator):
-    """
-    auto mode
-    """
-    logger.info("start auto mode")
-    
-    total_height = 0
-    processed_layers = 0
-    error_count = 0
-    
-    start_time = time.time()
-    
-    try:
-        for layer_data in data_parser.parse():
-            try:
-                has_predefined_error = False
-                if 'layer_error' in layer_data and layer_data['layer_error'] != 'SUCCESS':
-                    has_predefined_error = True
-                    error_msg = f"layer {layer_data.get('layer_id')} error: {layer_data['layer_error']}"
-                    error_handler.handle_error(error_msg, layer_data, automatic=True)
-                
-                image_path = None
-                if ('image_data' in layer_data and layer_data['image_data']) or ('image_url' in layer_data and layer_data['image_url']):
-                    image_path = output_manager.process_image(layer_data)
-                
-                output_manager.output_layer(layer_data, image_path)
-                
-                if 'height' in layer_data:
-                    total_height += float(layer_data['height'])
-                elif 'layer_height' in layer_data:
-                    total_height += float(layer_data['layer_height'])
-                    
-                processed_layers += 1
-                
-                if processed_layers % 100 == 0:
-                    logger.info(f"already {processed_layers} done...")
-                
-                if has_predefined_error:
-                    error_count += 1
-                
-            except Exception as e:
-                error_count += 1
-                error_handler.handle_error(
-                    f"process {layer_data.get('layer_id', processed_layers + 1)} error: {str(e)}",
-                    layer_data,
-                    automatic=True
-                )
-    except Exception as e:
-        logger.error(f"error: {e}")
-        return False
-        
-    elapsed_time = time.time() - start_time
-    
-    summary_generator.generate(
-        processed_layers=processed_layers, 
-        total_height=total_height,
-        error_count=error_count,
-        elapsed_time=elapsed_time,
-        terminated_early=False
-    )
-    
-    return True
-
-
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        from batch_runner import run_batch
+        return run_batch(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'summarize':
+        from summary_rebuilder import run_summarize
+        return run_summarize(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'query':
+        from layer_index import run_query
+        return run_query(sys.argv[2:])
+    
+    # a single run needs PIL, numpy and matplotlib, the subcommands above import only what they use
+    from image_processor import ImageProcessor
+    from print_clock import PrintClock, LayerSchedule
+    from print_job import create_job, run_supervised_mode, run_automatic_mode
+
     args = parse_arguments()
     
     print(f"\n===== FakePrinter =====")
@@ -199,26 +74,37 @@ def main():
     print(f"output path: {args.output_folder}")
     print(f"mode: {args.mode}")
     print(f"data file: {args.data}")
+    print(f"image dedup: {args.dedup}")
+    print(f"image format: {args.image_format} (level {args.compress_level}, workers {args.encode_workers})")
+    print(f"memory budget: {format_file_size(args.max_memory) if args.max_memory else 'unlimited'}")
+    if args.speed is not None:
+        print(f"print clock: {'as fast as possible' if args.speed <= 0 else f'x{args.speed:g}'}")
     print(f"==============================\n")
     
-    print_dir = os.path.join(args.output_folder, args.print_name)
-    os.makedirs(print_dir, exist_ok=True)
-    
-    images_dir = os.path.join(print_dir, "images")
-    os.makedirs(images_dir, exist_ok=True)
-    
-    error_log_path = os.path.join(print_dir, "error.log")
+    ImageProcessor.configure_downloads()
+    print_dir, data_parser, output_manager, error_handler, summary_generator = create_job(
+        args.print_name, args.output_folder, args.data, args
+    )
     
-    data_parser = DataParser(args.data)
-    output_manager = OutputManager(print_dir, images_dir, args.print_name)
-    error_handler = ErrorHandler(error_log_path)
-    summary_generator = SummaryGenerator(print_dir)
+    print_clock = None
+    layer_schedule = None
+    if args.speed is not None:
+        print_clock = PrintClock(args.speed)
+        layer_schedule = LayerSchedule.from_parser(data_parser, print_clock)
+        logger.info(f"print clock: {len(layer_schedule.end_times)} layers, "
+                    f"simulated print time {format_time(layer_schedule.total_sim_time)}")
     
     success = False
-    if args.mode == 'supervised':
-        success = run_supervised_mode(data_parser, output_manager, error_handler, summary_generator)
-    else:  # automatic mode
-        success = run_automatic_mode(data_parser, output_manager, error_handler, summary_generator)
+    try:
+        if args.mode == 'supervised':
+            success = run_supervised_mode(data_parser, output_manager, error_handler, summary_generator,
+                                          layer_schedule)
+        else:  # automatic mode
+            success = run_automatic_mode(data_parser, output_manager, error_handler, summary_generator,
+                                         layer_schedule)
+    finally:
+        if print_clock:
+            print_clock.stop()
     
     if success:
         logger.info(f"task '{args.print_name}' finished，store in '{print_dir}'")
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""
+Memory Budget Module
+In-flight bytes accounting and RSS sampling for bounded-memory runs
+"""
+
+import os
+import sys
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss():
+    """
+    resident set size of this process in bytes, 0 if unknown
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is kilobytes on Linux and bytes on macOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+def estimate_image_bytes(image):
+    """
+    approximate decoded size of a PIL image
+    """
+    try:
+        return image.width * image.height * len(image.getbands())
+    except Exception:
+        return 0
+
+
+class MemoryBudget:
+    """
+    Memory Budget: caps bytes held between pipeline stages and samples RSS,
+    one budget can be shared by the jobs of a batch
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.baseline_rss = current_rss()
+        self._lock = threading.Lock()
+        # signalled on release, jobs sharing the budget wait on it for each other's bytes
+        self._released = threading.Condition(self._lock)
+        # fixed allocations such as a shared image cache, taken off the in-flight limit
+        self.reserved_bytes = 0
+
+        self.in_flight_bytes = 0
+        self.peak_in_flight_bytes = 0
+        self.acquire_waits = 0
+
+        self.rss_samples = 0
+        self.last_rss = self.baseline_rss
+        self.peak_rss = self.baseline_rss
+        self.over_budget_count = 0
+
+    @property
+    def in_flight_limit(self):
+        """
+        bytes the pipeline may hold on top of the interpreter baseline
+        """
+        if self.max_bytes is None:
+            return None
+        return max(self.max_bytes - self.baseline_rss - self.reserved_bytes, 0)
+
+    def reserve(self, nbytes, name='reserved'):
+        self.reserved_bytes += nbytes
+        if self.max_bytes is not None and self.reserved_bytes >= self.max_bytes - self.baseline_rss:
+            logger.warning(f"{name} ({nbytes} bytes) leaves no room in the memory budget")
+
+    def _fits(self, nbytes, limit):
+        # a single item larger than the budget still has to go through on its own
+        return limit is None or self.in_flight_bytes == 0 or self.in_flight_bytes + nbytes <= limit
+
+    def can_acquire(self, nbytes):
+        limit = self.in_flight_limit
+        with self._lock:
+            return self._fits(nbytes, limit)
+
+    def acquire(self, nbytes, block=False):
+        """
+        account nbytes as in flight; with block, first wait until they fit, which only happens
+        when other holders of the budget have them, a caller must release its own bytes first
+        """
+        limit = self.in_flight_limit
+        with self._lock:
+            if block and not self._fits(nbytes, limit):
+                self.acquire_waits += 1
+                while not self._fits(nbytes, limit):
+                    self._released.wait()
+            self.in_flight_bytes += nbytes
+            self.peak_in_flight_bytes = max(self.peak_in_flight_bytes, self.in_flight_bytes)
+
+    def release(self, nbytes):
+        with self._lock:
+            self.in_flight_bytes = max(self.in_flight_bytes - nbytes, 0)
+            self._released.notify_all()
+
+    def sample(self):
+        """
+        record current RSS, returns True when it is over the budget
+        """
+        rss = current_rss()
+        with self._lock:
+            self.rss_samples += 1
+            self.last_rss = rss
+            self.peak_rss = max(self.peak_rss, rss)
+            over_budget = self.max_bytes is not None and rss > self.max_bytes
+            if over_budget:
+                self.over_budget_count += 1
+
+        if over_budget:
+            logger.warning(f"memory over budget: rss {rss} > {self.max_bytes} bytes")
+            return True
+        return False
+
+    def get_stats(self):
+        return {
+            'max_bytes': self.max_bytes,
+            'baseline_rss': self.baseline_rss,
+            'reserved_bytes': self.reserved_bytes,
+            'last_rss': self.last_rss,
+            'peak_rss': self.peak_rss,
+            'rss_samples': self.rss_samples,
+            'peak_in_flight_bytes': self.peak_in_flight_bytes,
+            'acquire_waits': self.acquire_waits,
+            'over_budget_count': self.over_budget_count,
+        }
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+"""
+Output Layout Module
+Batch directory layout of a print's images, created ahead of the layer cursor
+"""
+
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+IMAGE_BATCH_SIZE = 1000
+# batches whose directories are created before the cursor reaches them
+BATCH_LOOKAHEAD = 2
+
+# dir_fd-relative creation saves resolving the whole path for every file, where the platform has it
+DIR_FD_SUPPORTED = os.open in os.supports_dir_fd and hasattr(os, 'O_DIRECTORY')
+UNLINK_DIR_FD_SUPPORTED = DIR_FD_SUPPORTED and os.unlink in os.supports_dir_fd
+LINK_DIR_FD_SUPPORTED = UNLINK_DIR_FD_SUPPORTED and os.link in os.supports_dir_fd
+# files are always created fresh: an existing entry may be a dedup hardlink whose inode
+# other layers share, truncating it would rewrite all of them
+FILE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0) | getattr(os, 'O_CLOEXEC', 0)
+
+
+def batch_num(layer_id, batch_size=IMAGE_BATCH_SIZE):
+    """
+    image batch of a layer, layer 1000 opens the second batch (001001-002000)
+    """
+    return int(int(layer_id) / batch_size) if str(layer_id).isdigit() else 0
+
+
+def batch_name(batch_num, batch_size=IMAGE_BATCH_SIZE):
+    return f"{batch_num * batch_size + 1:06d}-{(batch_num + 1) * batch_size:06d}"
+
+
+class _BatchDirectory:
+    """
+    an open batch directory and the files written into it since the last fsync
+    """
+
+    def __init__(self, path, batch_num):
+        self.path = path
+        self.batch_num = batch_num
+        self.fd = None
+        if DIR_FD_SUPPORTED:
+            self.fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY | getattr(os, 'O_CLOEXEC', 0))
+        self.unsynced = []
+
+
+class OutputLayout:
+    """
+    Output Layout: cached batch directory paths, dir_fd-relative image writes and per-batch fsync
+    """
+
+    def __init__(self, output_dir, images_dir, batch_size=IMAGE_BATCH_SIZE, lookahead=BATCH_LOOKAHEAD,
+                 subdirs=(), fsync=False):
+        self.output_dir = output_dir
+        self.images_dir = images_dir
+        self.batch_size = batch_size
+        self.lookahead = lookahead
+        # per-batch subdirectories such as thumbnails/, created together with the batch
+        self.subdirs = tuple(subdirs)
+        self.fsync = fsync
+
+        self._output_prefix = os.path.join(output_dir, '')
+        # batch number -> (batch dir, batch dir relative to output_dir)
+        self._batch_dirs = {}
+        # batch dir and subdir path -> batch number
+        self._dir_batches = {}
+        self._created = set()
+        # open directories by path, only the batches around the cursor are kept
+        self._open_dirs = {}
+        self._written_dirs = set()
+        self._cursor = None
+
+    def batch_num(self, layer_id):
+        return batch_num(layer_id, self.batch_size)
+
+    def _batch_dir(self, batch_num):
+        cached = self._batch_dirs.get(batch_num)
+        if cached is None:
+            path = os.path.join(self.images_dir, batch_name(batch_num, self.batch_size))
+            cached = self._batch_dirs[batch_num] = (path, self.relative(path))
+            self._dir_batches[path] = batch_num
+            for subdir in self.subdirs:
+                self._dir_batches[os.path.join(path, subdir)] = batch_num
+        return cached
+
+    def _create_batch(self, batch_num):
+        if batch_num in self._created:
+            return
+        path = self._batch_dir(batch_num)[0]
+        for directory in [path] + [os.path.join(path, subdir) for subdir in self.subdirs]:
+            os.makedirs(directory, exist_ok=True)
+        self._created.add(batch_num)
+
+    def _advance(self, batch_num):
+        """
+        move the cursor to batch_num: create the batches ahead, retire the ones well behind
+        """
+        if batch_num == self._cursor:
+            return
+        for ahead in range(batch_num, batch_num + self.lookahead + 1):
+            self._create_batch(ahead)
+        # the previous batch stays open, encodes still in flight may land there
+        for path, directory in list(self._open_dirs.items()):
+            if abs(directory.batch_num - batch_num) > 1:
+                self._retire(path)
+        self._cursor = batch_num
+
+    def image_path(self, layer_id, filename):
+        """
+        (absolute path, path relative to output_dir) of a layer image, its batch directory exists
+        """
+        batch_num = self.batch_num(layer_id)
+        self._advance(batch_num)
+        path, rel_dir = self._batch_dir(batch_num)
+        return os.path.join(path, filename), os.path.join(rel_dir, filename)
+
+    def relative(self, path):
+        """
+        path relative to output_dir, without os.path.relpath for paths built under it
+        """
+        if path.startswith(self._output_prefix):
+            return path[len(self._output_prefix):]
+        return os.path.relpath(path, self.output_dir)
+
+    def _open_dir(self, path):
+        directory = self._open_dirs.get(path)
+        if directory is None:
+            # a late write to an older batch must not keep its directory open as if it were current
+            batch_num = self._dir_batches.get(path)
+            if batch_num is None:
+                batch_num = self._cursor if self._cursor is not None else 0
+            if not os.path.isdir(path):
+                os.makedirs(path, exist_ok=True)
+            directory = self._open_dirs[path] = _BatchDirectory(path, batch_num)
+            self._written_dirs.add(path)
+        return directory
+
+    def write_file(self, data, output_path):
+        """
+        write data to output_path relative to its open batch directory
+        """
+        if data is None:
+            return False
+
+        try:
+            dir_path, name = os.path.split(output_path)
+            directory = self._open_dir(dir_path)
+            if directory.fd is not None and UNLINK_DIR_FD_SUPPORTED:
+                try:
+                    os.unlink(name, dir_fd=directory.fd)
+                except FileNotFoundError:
+                    pass
+                fd = os.open(name, FILE_FLAGS, 0o644, dir_fd=directory.fd)
+            else:
+                try:
+                    os.remove(output_path)
+                except FileNotFoundError:
+                    pass
+                fd = os.open(output_path, FILE_FLAGS, 0o644)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+
+            if self.fsync:
+                directory.unsynced.append(name)
+            logger.debug(f"image save as: {output_path}")
+            return True
+        except Exception as e:
+            logger.error(f"image save error: {e}")
+            return False
+
+    def link_file(self, source_path, output_path):
+        """
+        hardlink output_path to source_path inside its open batch directory, raises OSError as os.link
+        """
+        dir_path, name = os.path.split(output_path)
+        directory = self._open_dir(dir_path)
+        if directory.fd is not None and LINK_DIR_FD_SUPPORTED:
+            try:
+                os.unlink(name, dir_fd=directory.fd)
+            except FileNotFoundError:
+                pass
+            os.link(source_path, name, dst_dir_fd=directory.fd)
+        else:
+            if os.path.lexists(output_path):
+                os.remove(output_path)
+            os.link(source_path, output_path)
+
+        # the new directory entry is only durable once the directory is synced
+        if self.fsync:
+            directory.unsynced.append(name)
+
+    def _sync(self, directory):
+        """
+        fsync every file written to the directory since the last sync, then the directory once
+        """
+        if not directory.unsynced:
+            return
+        flags = os.O_RDONLY | getattr(os, 'O_BINARY', 0)
+        try:
+            for name in directory.unsynced:
+                if directory.fd is not None:
+                    fd = os.open(name, flags, dir_fd=directory.fd)
+                else:
+                    fd = os.open(os.path.join(directory.path, name), flags)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            if directory.fd is not None:
+                os.fsync(directory.fd)
+        except OSError as e:
+            logger.error(f"fsync {directory.path} error: {e}")
+        directory.unsynced = []
+
+    def _retire(self, path):
+        directory = self._open_dirs.pop(path)
+        if self.fsync:
+            self._sync(directory)
+        if directory.fd is not None:
+            os.close(directory.fd)
+
+    def close(self):
+        """
+        sync and close all open batch directories
+        """
+        for path in list(self._open_dirs):
+            self._retire(path)
+
+        # batches created ahead that never got an image are not left behind empty
+        for batch_num in self._created:
+            path = self._batch_dir(batch_num)[0]
+            for directory in [os.path.join(path, subdir) for subdir in self.subdirs] + [path]:
+                if directory not in self._written_dirs:
+                    try:
+                        os.rmdir(directory)
+                    except OSError:
+                        pass
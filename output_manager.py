@@ -10,9 +10,15 @@ import json
 import csv
 import logging
 import shutil
+from collections import deque
 from pathlib import Path
 
 from image_processor import ImageProcessor
+from image_deduplicator import ImageDeduplicator
+from image_encoder import ImageEncoder
+from memory_budget import MemoryBudget, estimate_image_bytes
+from compressed_io import CompressedStreamWriter, compressed_path, remove_other_variants
+from output_layout import OutputLayout
 
 logger = logging.getLogger(__name__)
 
@@ -22,30 +28,115 @@ class OutputManager:
     Output Manager: manages output data to the file system
     """
     
-    def __init__(self, output_dir, images_dir, print_name):
+    def __init__(self, output_dir, images_dir, print_name, dedup_mode='off',
+                 dedup_perceptual=False, dedup_max_distance=0, image_format='png',
+                 compress_level=6, optimize=False, thumbnail_size=None, encode_workers=0,
+                 max_memory=None, rss_sample_interval=100, encode_pool=None,
+                 output_compression='none', output_compression_level=None, fsync=False,
+                 error_handler=None, memory_budget=None):
 
         self.output_dir = output_dir
         self.images_dir = images_dir
         self.print_name = print_name
-        
+        # receives images that fail after their layer was already written
+        self.error_handler = error_handler
+        self.deferred_failures = 0
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs(self.images_dir, exist_ok=True)
-        self.layers_csv_path = os.path.join(self.output_dir, 'layers.csv')
-        self.layers_json_path = os.path.join(self.output_dir, 'layers.json')
-        self._init_layers_csv()
+        self.layout = OutputLayout(
+            output_dir, images_dir,
+            subdirs=('thumbnails',) if thumbnail_size else (),
+            fsync=fsync
+        )
+        self.deduplicator = None
+        if dedup_mode != 'off':
+            self.deduplicator = ImageDeduplicator(
+                mode=dedup_mode,
+                perceptual=dedup_perceptual,
+                max_distance=dedup_max_distance,
+                writer=self.layout.write_file,
+                linker=self.layout.link_file
+            )
+        self.encoder = ImageEncoder(
+            image_format=image_format,
+            compress_level=compress_level,
+            optimize=optimize,
+            thumbnail_size=thumbnail_size,
+            workers=encode_workers,
+            # the perceptual hash is only used by dedup
+            perceptual=dedup_perceptual and self.deduplicator is not None,
+            pool=encode_pool
+        )
+        # (layer_id, image_path, future, in-flight bytes) of images still being encoded
+        self._pending_images = deque()
+        self.max_pending_images = max(1, encode_workers * 2)
+        # batch jobs share one budget, a single run gets its own
+        self.memory_budget = memory_budget if memory_budget is not None else MemoryBudget(max_memory)
+        self.rss_sample_interval = rss_sample_interval
+        self._layers_written = 0
         
-        # init json
-        with open(self.layers_json_path, 'w', encoding='utf-8') as f:
-            json.dump([], f)
+        self.compression = output_compression
+        for name in ('layers.csv', 'layers.json'):
+            remove_other_variants(os.path.join(self.output_dir, name), output_compression)
+        self.layers_csv_path = compressed_path(os.path.join(self.output_dir, 'layers.csv'), output_compression)
+        self.layers_json_path = compressed_path(os.path.join(self.output_dir, 'layers.json'), output_compression)
+        
+        # compressed outputs are streams fed to a background compression thread
+        self._csv_stream = None
+        self._json_stream = None
+        if output_compression != 'none':
+            self._csv_stream = CompressedStreamWriter(self.layers_csv_path, output_compression,
+                                                      output_compression_level)
+            self._json_stream = CompressedStreamWriter(self.layers_json_path, output_compression,
+                                                       output_compression_level)
+            self._csv_writer = csv.writer(self._csv_stream)
+        self._init_layers_csv()
+        self._init_layers_json()
         
     def _init_layers_csv(self):
+        header = [
+            'layer_id', 'status', 'height', 'material_type', 'extrusion_temperature',
+            'print_speed', 'layer_adhesion_quality', 'infill_density', 'infill_pattern',
+            'image_file', 'processing_time'
+        ]
+        if self._csv_stream is not None:
+            self._csv_writer.writerow(header)
+            return
         with open(self.layers_csv_path, 'w', newline='', encoding='utf-8') as f:
             writer = csv.writer(f)
-            writer.writerow([
-                'layer_id', 'status', 'height', 'material_type', 'extrusion_temperature',
-                'print_speed', 'layer_adhesion_quality', 'infill_density', 'infill_pattern',
-                'image_file', 'processing_time'
-            ])
+            writer.writerow(header)
+    
+    def _init_layers_json(self):
+        self._json_items = 0
+        if self._json_stream is not None:
+            # a compressed stream cannot be rewritten, the array is closed in close()
+            self._json_stream.write('[')
+            return
+        
+        # the array is streamed: each layer is written over the closing bracket,
+        # so the file stays valid JSON without ever loading it back
+        self._json_file = open(self.layers_json_path, 'wb')
+        self._json_file.write(b'[]')
+        self._json_file.flush()
+        self._json_tail = 1
+    
+    def _append_layer_json(self, output_data):
+        if self._json_stream is not None:
+            # compact, nobody reads the compressed file by eye
+            item = json.dumps(output_data, ensure_ascii=False, separators=(',', ':'))
+            self._json_stream.write(f"{',' if self._json_items else ''}\n{item}")
+            self._json_items += 1
+            return
+        
+        item = json.dumps(output_data, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+        separator = ',\n  ' if self._json_items else '\n  '
+        chunk = f"{separator}{item}".encode('utf-8')
+        
+        self._json_file.seek(self._json_tail)
+        self._json_file.write(chunk + b'\n]')
+        self._json_file.flush()
+        self._json_tail += len(chunk)
+        self._json_items += 1
     
     def process_image(self, layer_data):
         """
@@ -53,20 +144,22 @@ class OutputManager:
         """
         layer_id = layer_data.get('layer_id', 'unknown')
         
-        batch_num = int(int(layer_id) / 1000) if isinstance(layer_id, (int, str)) and str(layer_id).isdigit() else 0
-        batch_dir = os.path.join(self.images_dir, f"{batch_num*1000+1:06d}-{(batch_num+1)*1000:06d}")
-        os.makedirs(batch_dir, exist_ok=True)
-        
         image_filename = None
         if 'file_name' in layer_data and layer_data['file_name']:
             image_filename = layer_data['file_name']
         else:
             image_filename = f"layer_{str(layer_id).zfill(6)}.png"
+        image_filename = self.encoder.output_filename(image_filename)
             
-        image_path = os.path.join(batch_dir, image_filename)
+        # the batch directory is cached and already created by the layout
+        image_path, _ = self.layout.image_path(layer_id, image_filename)
         
         # image process
         try:
+            # finished encodes are written as they come in, another job sharing the budget may wait for their bytes
+            while self._pending_images and self._pending_images[0][2].done():
+                self._write_encoded_image(*self._pending_images.popleft())
+
             image_data = None
             
             if 'image_url' in layer_data and layer_data['image_url']:
@@ -76,15 +169,110 @@ class OutputManager:
                 return None
                 
             image = ImageProcessor.decode_image(image_data)
-            if image and ImageProcessor.save_image(image, image_path):
-                return image_path
-            else:
+            if not image:
                 logger.error(f"layer {layer_id} error")
-                return None        
+                return None
+            
+            # backpressure: finish older encodes until this image fits in the budget, then wait
+            # for the bytes other jobs sharing the budget still hold
+            image_bytes = estimate_image_bytes(image)
+            while self._pending_images and not self.memory_budget.can_acquire(image_bytes):
+                self._write_encoded_image(*self._pending_images.popleft())
+            self.memory_budget.acquire(image_bytes, block=True)
+            try:
+                future = self.encoder.submit(image)
+            except Exception:
+                self.memory_budget.release(image_bytes)
+                raise
+            
+            self._pending_images.append((layer_id, image_path, future, image_bytes))
+            
+            # the recorded path is only known once a referencing dedup has seen the bytes
+            if self.encoder.workers == 0 or (self.deduplicator and self.deduplicator.mode == 'reference'):
+                return self._write_encoded_image(*self._pending_images.popleft(), deferred=False)
+            
+            while len(self._pending_images) > self.max_pending_images:
+                self._write_encoded_image(*self._pending_images.popleft())
+            return image_path
         except Exception as e:
             logger.error(f"layer {layer_id} error: {e}")
             return None
     
+    def _write_encoded_image(self, layer_id, image_path, future, image_bytes=0, deferred=True):
+        """
+        write a finished encode; deferred images already have their path in layers.csv,
+        so a failure is reported to the error handler instead of returned
+        """
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"layer {layer_id} encode error: {e}")
+            return self._image_failed(layer_id, image_path, f"encode error: {e}", deferred)
+        finally:
+            self.memory_budget.release(image_bytes)
+        
+        self.encoder.record(result)
+        
+        if result['thumbnail']:
+            thumb_path = os.path.join(os.path.dirname(image_path), 'thumbnails', os.path.basename(image_path))
+            self.layout.write_file(result['thumbnail'], thumb_path)
+        
+        if self.deduplicator:
+            stored_path = self.deduplicator.store(result['data'], image_path, result['phash'])
+        elif self.layout.write_file(result['data'], image_path):
+            stored_path = image_path
+        else:
+            stored_path = None
+            
+        if not stored_path:
+            logger.error(f"layer {layer_id} error")
+            return self._image_failed(layer_id, image_path, "write error", deferred)
+        return stored_path
+    
+    def _image_failed(self, layer_id, image_path, reason, deferred):
+        if deferred:
+            self.deferred_failures += 1
+            if self.error_handler is not None:
+                self.error_handler.handle_error(
+                    f"layer {layer_id} image {reason}, {os.path.basename(image_path)} is missing",
+                    {'layer_id': layer_id, 'error_type': 'image write fail'},
+                    automatic=True
+                )
+        return None
+    
+    def flush_images(self):
+        """
+        wait for all in-flight image encodes and write them
+        """
+        while self._pending_images:
+            self._write_encoded_image(*self._pending_images.popleft())
+    
+    def close(self):
+        """
+        flush pending images and stop the encode workers
+        """
+        try:
+            self.flush_images()
+            self.layout.close()
+            self.encoder.close()
+        finally:
+            # each stream is closed on its own, a failing one must not leave the other unterminated
+            if self._json_stream is not None:
+                try:
+                    try:
+                        self._json_stream.write('\n]')
+                    finally:
+                        self._json_stream.close()
+                except Exception as e:
+                    logger.error(f"close compressed json output error: {e}")
+                try:
+                    self._csv_stream.close()
+                except Exception as e:
+                    logger.error(f"close compressed csv output error: {e}")
+            elif not self._json_file.closed:
+                self._json_file.close()
+        self.memory_budget.sample()
+    
     def output_layer(self, layer_data, image_path=None):
         """
         out put to file system
@@ -97,48 +285,81 @@ class OutputManager:
             
             output_data = {k: v for k, v in layer_data.items() if not any(img_field in k.lower() for img_field in ['image_url', 'image', 'img', 'picture'])}
             
+            rel_image_path = self.layout.relative(image_path) if image_path else ''
             if image_path:
-                rel_path = os.path.relpath(image_path, self.output_dir)
-                output_data['image_file'] = rel_path
+                output_data['image_file'] = rel_image_path
                 
+            # info for CSV
+            material_type = layer_data.get('material_type', '')
+            extrusion_temp = layer_data.get('extrusion_temperature', '')
+            print_speed = layer_data.get('print_speed', '')
+            adhesion = layer_data.get('layer_adhesion_quality', '')
+            infill_density = layer_data.get('infill_density', '')
+            infill_pattern = layer_data.get('infill_pattern', '')
+            processing_time = layer_data.get('layer_time', '')
+            
+            row = [
+                layer_id, status, height, material_type, extrusion_temp,
+                print_speed, adhesion, infill_density, infill_pattern,
+                rel_image_path, processing_time
+            ]
+            
             # output csv
-            with open(self.layers_csv_path, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                
-                # info for CSV
-                material_type = layer_data.get('material_type', '')
-                extrusion_temp = layer_data.get('extrusion_temperature', '')
-                print_speed = layer_data.get('print_speed', '')
-                adhesion = layer_data.get('layer_adhesion_quality', '')
-                infill_density = layer_data.get('infill_density', '')
-                infill_pattern = layer_data.get('infill_pattern', '')
-                processing_time = layer_data.get('layer_time', '')
-                
-                # path for csv
-                rel_image_path = os.path.relpath(image_path, self.output_dir) if image_path else ''
-                
-                writer.writerow([
-                    layer_id, status, height, material_type, extrusion_temp,
-                    print_speed, adhesion, infill_density, infill_pattern,
-                    rel_image_path, processing_time
-                ])
+            if self._csv_stream is not None:
+                self._csv_writer.writerow(row)
+            else:
+                with open(self.layers_csv_path, 'a', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(row)
                 
             try:
-                with open(self.layers_json_path, 'r+', encoding='utf-8') as f:
-                    try:
-                        data = json.load(f)
-                    except json.JSONDecodeError:
-                        data = []
-                    
-                    data.append(output_data)
-                    f.seek(0)
-                    f.truncate()
-                    json.dump(data, f, ensure_ascii=False, indent=2)
+                self._append_layer_json(output_data)
             except Exception as e:
                 logger.error(f"write JSON error: {e}")
+            
+            self._layers_written += 1
+            if self.rss_sample_interval and self._layers_written % self.rss_sample_interval == 0:
+                if self.memory_budget.sample():
+                    self.flush_images()
                 
             return True
             
         except Exception as e:
             logger.error(f"output {layer_data.get('layer_id', 'unknown')} error: {e}")
             return False
+    
+    def get_encode_stats(self):
+        """
+        per format encode timing and byte totals
+        """
+        stats = self.encoder.get_stats()
+        stats['deferred_failures'] = self.deferred_failures
+        return stats
+    
+    def get_compression_stats(self):
+        """
+        uncompressed vs written bytes of compressed outputs, None when not compressed
+        """
+        if self._csv_stream is None:
+            return None
+        return {
+            'compression': self.compression,
+            'files': [self._csv_stream.get_stats(), self._json_stream.get_stats()],
+        }
+    
+    def get_layers_written(self):
+        return self._layers_written
+    
+    def get_memory_stats(self):
+        """
+        RSS samples and in-flight bytes against the memory budget
+        """
+        return self.memory_budget.get_stats()
+    
+    def get_dedup_stats(self):
+        """
+        dedup statistics, None when dedup is off
+        """
+        if self.deduplicator is None:
+            return None
+        return self.deduplicator.get_stats()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""
+Print Clock Module
+Replays a print job on the schedule given by its Layer Time column
+"""
+
+import re
+import math
+import time
+import heapq
+import itertools
+import logging
+import threading
+from array import array
+
+logger = logging.getLogger(__name__)
+
+
+LAYER_TIME_UNITS = {
+    'h': 3600, 'hr': 3600, 'hour': 3600, 'hours': 3600,
+    'm': 60, 'min': 60, 'mins': 60, 'minute': 60, 'minutes': 60,
+    's': 1, 'sec': 1, 'secs': 1, 'second': 1, 'seconds': 1,
+}
+LAYER_TIME_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*([a-z]+)')
+# all that may stand between and around the value-unit pairs
+LAYER_TIME_SEPARATORS = re.compile(r'[\s_,]*')
+
+# a layer finishing later than this behind schedule counts as late
+LATE_THRESHOLD = 0.05
+
+
+def parse_layer_time(text):
+    """
+    parse a layer time such as '5min_12sec' into seconds, None if it cannot be parsed
+    (negative, not finite, unknown units or text left over such as the '12' of '5min12')
+    """
+    text = (text or '').strip().lower()
+    if not text:
+        return None
+    try:
+        seconds = float(text)
+    except ValueError:
+        pass
+    else:
+        return seconds if math.isfinite(seconds) and seconds >= 0 else None
+
+    seconds = 0.0
+    matched = False
+    position = 0
+    for match in LAYER_TIME_PATTERN.finditer(text):
+        value, unit = match.groups()
+        if unit not in LAYER_TIME_UNITS or not LAYER_TIME_SEPARATORS.fullmatch(text, position, match.start()):
+            return None
+        seconds += float(value) * LAYER_TIME_UNITS[unit]
+        matched = True
+        position = match.end()
+    if not matched or not LAYER_TIME_SEPARATORS.fullmatch(text, position):
+        return None
+    return seconds
+
+
+class PrintClock:
+    """
+    Print Clock: one timer thread and heap waking every waiting layer on time
+    """
+
+    def __init__(self, speed=1.0):
+        # speed 0 replays as fast as possible
+        self.speed = speed
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def realtime(self):
+        return self.speed > 0
+
+    def _ensure_timer(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='print-clock', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        with self._cond:
+            while not self._stopped:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                timeout = self._heap[0][0] - time.monotonic()
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                    continue
+                _, _, event = heapq.heappop(self._heap)
+                event.set()
+
+    def wait(self, deadline):
+        """
+        block until the monotonic deadline, returns how late the caller is in seconds
+        """
+        if not self.realtime:
+            return 0.0
+        now = time.monotonic()
+        if now >= deadline:
+            return now - deadline
+
+        event = threading.Event()
+        with self._cond:
+            # checked under the lock, a waiter pushed after stop() would never be woken
+            if self._stopped:
+                return 0.0
+            self._ensure_timer()
+            heapq.heappush(self._heap, (deadline, next(self._seq), event))
+            self._cond.notify()
+        event.wait()
+        return max(time.monotonic() - deadline, 0.0)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            for _, _, event in self._heap:
+                event.set()
+            self._heap.clear()
+            self._cond.notify_all()
+
+
+class LayerSchedule:
+    """
+    Layer Schedule: simulated finish time of every layer, parsed once up front
+    """
+
+    def __init__(self, layer_times, clock):
+        self.clock = clock
+        self.unparsed_times = 0
+
+        # cumulative simulated end time of each layer, in seconds
+        self.end_times = array('d')
+        parsed = {}
+        total = 0.0
+        for text in layer_times:
+            seconds = parsed.get(text)
+            if seconds is None:
+                seconds = parse_layer_time(text)
+                if seconds is None:
+                    self.unparsed_times += 1
+                    seconds = 0.0
+                parsed[text] = seconds
+            total += seconds
+            self.end_times.append(total)
+
+        self._wall_start = None
+        self._layers = 0
+        self._late_layers = 0
+        self._max_lag = 0.0
+        self._sim_time = 0.0
+
+        if self.unparsed_times:
+            logger.warning(f"{self.unparsed_times} layer times cannot be parsed, counted as 0 sec")
+
+    @classmethod
+    def from_parser(cls, data_parser, clock):
+        return cls(data_parser.iter_column('layer_time'), clock)
+
+    @property
+    def total_sim_time(self):
+        return self.end_times[-1] if self.end_times else 0.0
+
+    def wait_for_layer(self, row_index):
+        """
+        block until layer row_index (0-based) has finished printing on the simulated clock
+        """
+        if self._wall_start is None:
+            self._wall_start = time.monotonic()
+        if not self.end_times:
+            return
+
+        sim_time = self.end_times[min(row_index, len(self.end_times) - 1)]
+        deadline = self._wall_start + sim_time / self.clock.speed if self.clock.realtime else 0.0
+        lag = self.clock.wait(deadline)
+
+        self._layers += 1
+        self._sim_time = sim_time
+        if lag > LATE_THRESHOLD:
+            self._late_layers += 1
+        self._max_lag = max(self._max_lag, lag)
+
+    def get_stats(self):
+        wall_time = time.monotonic() - self._wall_start if self._wall_start is not None else 0.0
+        return {
+            'speed': self.clock.speed,
+            'layers': self._layers,
+            'simulated_time': self._sim_time,
+            'total_simulated_time': self.total_sim_time,
+            'scheduled_wall_time': self._sim_time / self.clock.speed if self.clock.realtime else 0.0,
+            'wall_time': wall_time,
+            'late_layers': self._late_layers,
+            'max_lag': self._max_lag,
+            'unparsed_times': self.unparsed_times,
+        }
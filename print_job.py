@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+
+"""
+Print Job Module
+Options, setup and processing loops of one print job, shared by single and batch runs
+"""
+
+import os
+import time
+import logging
+
+from data_parser import DataParser
+from output_manager import OutputManager
+from error_handler import ErrorHandler
+from summary_generator import SummaryGenerator
+from image_deduplicator import DEDUP_MODES
+from image_encoder import ENCODE_FORMATS
+from compressed_io import available_compressions, LEVEL_RANGES
+from utils import parse_size
+
+logger = logging.getLogger(__name__)
+
+
+def add_output_arguments(parser):
+    """Add the image and memory options shared by single and batch runs"""
+    parser.add_argument('--dedup', type=str, default='off', choices=list(DEDUP_MODES),
+                        help='Image dedup: off, hardlink duplicates, or reference the first copy in layers.csv')
+    parser.add_argument('--dedup-perceptual', action='store_true',
+                        help='Also treat near-identical images (perceptual hash) as duplicates')
+    parser.add_argument('--dedup-distance', type=int, default=4,
+                        help='Max perceptual hash bit distance for near duplicates (default: 4)')
+    parser.add_argument('--image-format', type=str, default='png', choices=list(ENCODE_FORMATS),
+                        help='Output image format: png or lossless webp (default: png)')
+    parser.add_argument('--compress-level', type=int, default=6, choices=range(10), metavar='[0-9]',
+                        help='Compression level, 0 fastest .. 9 smallest (default: 6)')
+    parser.add_argument('--optimize', action='store_true',
+                        help='Spend extra CPU searching for the smallest encoding')
+    parser.add_argument('--thumbnail-size', type=int, default=None,
+                        help='Also write thumbnails no larger than this many pixels per side')
+    parser.add_argument('--encode-workers', type=int, default=0,
+                        help='Number of processes encoding images, 0 encodes inline (default: 0)')
+    parser.add_argument('--max-memory', type=parse_size, default=None,
+                        help='Memory budget for the run, e.g. 512M or 2G (default: unlimited)')
+    parser.add_argument('--output-compression', type=str, default='none', choices=available_compressions(),
+                        help='Compress layers.csv and layers.json on a background thread (default: none)')
+    parser.add_argument('--output-compression-level', type=int, default=None,
+                        help='gzip (1-9) or zstd (1-22) level of the compressed outputs (default: 6 / 3)')
+    parser.add_argument('--fsync', action='store_true',
+                        help='fsync image files once per finished 1000-layer batch')
+    parser.add_argument('--speed', type=float, default=None,
+                        help='Replay layers on the Layer Time schedule at this speed multiplier, '
+                             '1 is real time, 0 is as fast as possible (default: no print clock)')
+
+
+def check_output_arguments(parser, args):
+    """
+    reject option combinations argparse cannot check on its own
+    """
+    if args.dedup_perceptual and args.dedup == 'off':
+        parser.error("--dedup-perceptual needs --dedup hardlink or reference")
+
+    level = args.output_compression_level
+    if level is not None:
+        if args.output_compression not in LEVEL_RANGES:
+            parser.error("--output-compression-level needs --output-compression gzip or zstd")
+        low, high = LEVEL_RANGES[args.output_compression]
+        if not low <= level <= high:
+            parser.error(f"--output-compression-level for {args.output_compression} must be {low}-{high}, got {level}")
+
+
+def run_supervised_mode(data_parser, output_manager, error_handler, summary_generator, layer_schedule=None):
+    """
+    Run in supervised mode - wait for user to press Enter to process each layer
+    """
+    logger.info("Running in supervised mode. Press Enter to process next layer, 'q' to quit")
+    
+    total_height = 0
+    processed_layers = 0
+    error_count = 0
+    
+    # start
+    start_time = time.time()
+    try:        # Process layer by layer
+        for row_index, layer_data in enumerate(data_parser.parse()):
+            if layer_schedule:
+                layer_schedule.wait_for_layer(row_index)
+            # wait for user input
+            user_input = input(f"\nReady to process layer {layer_data.get('layer_id', processed_layers + 1)}. Press Enter to continue, 'q' to quit: ")
+            if user_input.lower() == 'q':
+                logger.info("User manually terminated processing")
+                break
+            try:
+                has_predefined_error = False
+                if 'layer_error' in layer_data and layer_data['layer_error'] != 'SUCCESS':
+                    has_predefined_error = True
+                    error_msg = f"layer {layer_data.get('layer_id')} error: {layer_data['layer_error']}"
+                    choice = error_handler.handle_error(error_msg, layer_data)
+                    if choice == 'end':
+                        logger.info("stop")
+                        break
+
+                image_path = None
+                if ('image_data' in layer_data and layer_data['image_data']) or ('image_url' in layer_data and layer_data['image_url']):
+                    image_path = output_manager.process_image(layer_data)
+                
+                output_manager.output_layer(layer_data, image_path)
+                
+                if 'height' in layer_data:
+                    total_height += float(layer_data['height'])
+                elif 'layer_height' in layer_data:
+                    total_height += float(layer_data['layer_height'])
+                    
+                processed_layers += 1
+                logger.info(f" {layer_data.get('layer_id', processed_layers)} finish")
+                
+                if has_predefined_error:
+                    error_count += 1
+                
+            except Exception as e:
+                error_count += 1
+                # ask user, continue or not
+                choice = error_handler.handle_error(
+                    f"layer {layer_data.get('layer_id', processed_layers + 1)} error: {str(e)}",
+                    layer_data
+                )
+                
+                if choice == 'end':
+                    logger.info("end print")
+                    break
+    except Exception as e:
+        logger.error(f"error: {e}")
+        return False
+    finally:
+        output_manager.close()
+        error_handler.close()
+        
+    # images whose encode or write failed after their layer was written
+    error_count += output_manager.deferred_failures
+    elapsed_time = time.time() - start_time
+    
+    summary_generator.generate(
+        processed_layers=processed_layers, 
+        total_height=total_height,
+        error_count=error_count,
+        elapsed_time=elapsed_time,
+        terminated_early=(processed_layers < data_parser.get_estimated_total_layers()),
+        dedup_stats=output_manager.get_dedup_stats(),
+        encode_stats=output_manager.get_encode_stats(),
+        memory_stats=output_manager.get_memory_stats(),
+        schedule_stats=layer_schedule.get_stats() if layer_schedule else None,
+        error_stats=error_handler.get_error_stats(),
+        compression_stats=output_manager.get_compression_stats()
+    )
+    
+    return True
+
+
+def run_automatic_mode(data_parser, output_manager, error_handler, summary_generator, layer_schedule=None):
+    """
+    auto mode
+    """
+    logger.info("start auto mode")
+    
+    total_height = 0
+    processed_layers = 0
+    error_count = 0
+    
+    start_time = time.time()
+    
+    try:
+        for row_index, layer_data in enumerate(data_parser.parse()):
+            if layer_schedule:
+                layer_schedule.wait_for_layer(row_index)
+            try:
+                has_predefined_error = False
+                if 'layer_error' in layer_data and layer_data['layer_error'] != 'SUCCESS':
+                    has_predefined_error = True
+                    error_msg = f"layer {layer_data.get('layer_id')} error: {layer_data['layer_error']}"
+                    error_handler.handle_error(error_msg, layer_data, automatic=True)
+                
+                image_path = None
+                if ('image_data' in layer_data and layer_data['image_data']) or ('image_url' in layer_data and layer_data['image_url']):
+                    image_path = output_manager.process_image(layer_data)
+                
+                output_manager.output_layer(layer_data, image_path)
+                
+                if 'height' in layer_data:
+                    total_height += float(layer_data['height'])
+                elif 'layer_height' in layer_data:
+                    total_height += float(layer_data['layer_height'])
+                    
+                processed_layers += 1
+                
+                if processed_layers % 100 == 0:
+                    logger.info(f"already {processed_layers} done...")
+                
+                if has_predefined_error:
+                    error_count += 1
+                
+            except Exception as e:
+                error_count += 1
+                error_handler.handle_error(
+                    f"process {layer_data.get('layer_id', processed_layers + 1)} error: {str(e)}",
+                    layer_data,
+                    automatic=True
+                )
+    except Exception as e:
+        logger.error(f"error: {e}")
+        return False
+    finally:
+        output_manager.close()
+        error_handler.close()
+        
+    # images whose encode or write failed after their layer was written
+    error_count += output_manager.deferred_failures
+    elapsed_time = time.time() - start_time
+    
+    summary_generator.generate(
+        processed_layers=processed_layers, 
+        total_height=total_height,
+        error_count=error_count,
+        elapsed_time=elapsed_time,
+        terminated_early=False,
+        dedup_stats=output_manager.get_dedup_stats(),
+        encode_stats=output_manager.get_encode_stats(),
+        memory_stats=output_manager.get_memory_stats(),
+        schedule_stats=layer_schedule.get_stats() if layer_schedule else None,
+        error_stats=error_handler.get_error_stats(),
+        compression_stats=output_manager.get_compression_stats()
+    )
+    
+    return True
+
+
+def create_job(print_name, output_folder, data_file, args, encode_pool=None, memory_budget=None):
+    """
+    create the output folders and processing objects of one print job
+    """
+    print_dir = os.path.join(output_folder, print_name)
+    os.makedirs(print_dir, exist_ok=True)
+    
+    images_dir = os.path.join(print_dir, "images")
+    os.makedirs(images_dir, exist_ok=True)
+    
+    error_log_path = os.path.join(print_dir, "error.log")
+    
+    data_parser = DataParser(data_file)
+    error_handler = ErrorHandler(error_log_path)
+    output_manager = OutputManager(
+        print_dir, images_dir, print_name,
+        dedup_mode=args.dedup,
+        dedup_perceptual=args.dedup_perceptual,
+        dedup_max_distance=args.dedup_distance,
+        image_format=args.image_format,
+        compress_level=args.compress_level,
+        optimize=args.optimize,
+        thumbnail_size=args.thumbnail_size,
+        encode_workers=args.encode_workers,
+        max_memory=args.max_memory,
+        encode_pool=encode_pool,
+        output_compression=args.output_compression,
+        output_compression_level=args.output_compression_level,
+        fsync=args.fsync,
+        error_handler=error_handler,
+        memory_budget=memory_budget
+    )
+    summary_generator = SummaryGenerator(print_dir)
+    summary_generator.clear_run_stats()
+    
+    return print_dir, data_parser, output_manager, error_handler, summary_generator
@@ -8,34 +8,90 @@ summary_
 import os
 import json
 import logging
+import threading
 from datetime import datetime
 import matplotlib.pyplot as plt
 import matplotlib
 matplotlib.use('Agg')
 
+from utils import format_file_size, format_time
+
 logger = logging.getLogger(__name__)
 
+# pyplot keeps global state, batch jobs finishing together must not draw at once
+_chart_lock = threading.Lock()
+
+# stats only a run can measure, kept next to summary.txt so `main.py summarize` can bring them back
+RUN_STATS_FILENAME = 'run_stats.json'
+RUN_STATS_KEYS = ('elapsed_time', 'terminated_early', 'dedup_stats', 'encode_stats', 'memory_stats',
+                  'schedule_stats', 'compression_stats')
+
 
 class SummaryGenerator:
     def __init__(self, output_dir):
         self.output_dir = output_dir
         self.summary_txt_path = os.path.join(output_dir, 'summary.txt')
         self.summary_img_path = os.path.join(output_dir, 'summary.png')
+        self.run_stats_path = os.path.join(output_dir, RUN_STATS_FILENAME)
         
-    def generate(self, processed_layers, total_height, error_count=0, elapsed_time=0, terminated_early=False):
+    def generate(self, processed_layers, total_height, error_count=0, elapsed_time=0, terminated_early=False,
+                 dedup_stats=None, encode_stats=None, memory_stats=None,
+                 schedule_stats=None, error_stats=None, compression_stats=None):
+
+        try:
+            # what the output files cannot tell, a rebuild without run stats (elapsed_time None) keeps none
+            if elapsed_time is not None:
+                self._save_run_stats({
+                    'elapsed_time': elapsed_time, 'terminated_early': terminated_early,
+                    'dedup_stats': dedup_stats, 'encode_stats': encode_stats, 'memory_stats': memory_stats,
+                    'schedule_stats': schedule_stats, 'compression_stats': compression_stats,
+                })
 
-        try:            # text
-            self._generate_text_summary(processed_layers, total_height, error_count, elapsed_time, terminated_early)
+            # text
+            self._generate_text_summary(processed_layers, total_height, error_count, elapsed_time, terminated_early,
+                                        dedup_stats, encode_stats, memory_stats, schedule_stats, error_stats,
+                                        compression_stats)
             
             # table
-            self._generate_chart_summary(total_height, processed_layers, error_count)
+            with _chart_lock:
+                self._generate_chart_summary(total_height, processed_layers, error_count)
             
             logger.info(f"Report generated: {self.summary_txt_path}")
             return True
         except Exception as e:
             logger.error(f"Generate error: {e}")
             return False
-    def _generate_text_summary(self, processed_layers, total_height, error_count, elapsed_time, terminated_early):
+
+    def _save_run_stats(self, run_stats):
+        tmp_path = self.run_stats_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(run_stats, f, indent=2)
+        os.replace(tmp_path, self.run_stats_path)
+
+    def clear_run_stats(self):
+        """
+        drop the stats of an earlier run, its outputs are being rewritten
+        """
+        try:
+            os.remove(self.run_stats_path)
+        except FileNotFoundError:
+            pass
+
+    def load_run_stats(self):
+        """
+        generate() keyword arguments recorded by the last run, empty if there is none
+        """
+        try:
+            with open(self.run_stats_path, 'r', encoding='utf-8') as f:
+                run_stats = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(run_stats, dict):
+            return {}
+        return {key: run_stats[key] for key in RUN_STATS_KEYS if key in run_stats}
+    def _generate_text_summary(self, processed_layers, total_height, error_count, elapsed_time, terminated_early,
+                               dedup_stats=None, encode_stats=None, memory_stats=None,
+                               schedule_stats=None, error_stats=None, compression_stats=None):
         with open(self.summary_txt_path, 'w', encoding='utf-8') as f:
             f.write("# FakePrinter Print Task Summary Report\n")
             f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
@@ -51,7 +107,7 @@ class SummaryGenerator:
             
             # Error statistics
             f.write(f"- Error Count: {error_count}\n")
-            if error_count > 0:
+            if error_count > 0 and processed_layers > 0:
                 f.write(f"- Error Rate: {(error_count / processed_layers * 100):.2f}%\n")
               # Error information
             f.write("\n## Error Statistics\n")
@@ -60,13 +116,95 @@ class SummaryGenerator:
                 f.write("- Status: Print terminated early\n")
             else:
                 f.write("- Status: Print completed normally\n")
+            if error_stats and error_stats['by_type']:
+                f.write("- Errors By Type:\n")
+                for error_type, count in error_stats['by_type'].items():
+                    f.write(f"  - {error_type}: {count}\n")
+                f.write("- Most Affected Layer Batches:\n")
+                for batch, count in error_stats['by_batch'].items():
+                    f.write(f"  - {batch}: {count}\n")
+                f.write(f"- Consecutive Failure Runs: {error_stats['run_count']}, longest:\n")
+                for run in error_stats['longest_runs']:
+                    f.write(f"  - layers {run['first_layer']}-{run['last_layer']}: "
+                            f"{run['error_type']} x{run['count']}\n")
                 
             # Performance statistics
             f.write("\n## Performance Statistics\n")
-            f.write(f"- Total Processing Time: {elapsed_time:.2f} seconds\n")
-            if elapsed_time > 0 and processed_layers > 0:
+            if elapsed_time is None:
+                # rebuilt from output files, the run time is not recorded there
+                f.write("- Total Processing Time: unknown (summary rebuilt from outputs)\n")
+            else:
+                f.write(f"- Total Processing Time: {elapsed_time:.2f} seconds\n")
+            if elapsed_time and processed_layers > 0:
                 f.write(f"- Average Processing Time Per Layer: {(elapsed_time / processed_layers) * 1000:.2f} milliseconds\n")
                 
+            # Print clock statistics
+            if schedule_stats:
+                f.write("\n## Print Clock\n")
+                speed = schedule_stats['speed']
+                f.write(f"- Replay Speed: {'as fast as possible' if speed <= 0 else f'x{speed:g}'}\n")
+                f.write(f"- Simulated Print Time: {format_time(schedule_stats['simulated_time'])} "
+                        f"of {format_time(schedule_stats['total_simulated_time'])}\n")
+                if speed > 0:
+                    f.write(f"- Scheduled Wall Time: {format_time(schedule_stats['scheduled_wall_time'])}\n")
+                f.write(f"- Actual Wall Time: {format_time(schedule_stats['wall_time'])}\n")
+                f.write(f"- Late Layers: {schedule_stats['late_layers']} of {schedule_stats['layers']} "
+                        f"(max lag {schedule_stats['max_lag']:.3f} s)\n")
+                if schedule_stats['unparsed_times']:
+                    f.write(f"- Unparsed Layer Times: {schedule_stats['unparsed_times']}\n")
+                
+            # Image dedup statistics
+            if dedup_stats:
+                f.write("\n## Image Deduplication\n")
+                f.write(f"- Mode: {dedup_stats['mode']}{' + perceptual' if dedup_stats['perceptual'] else ''}\n")
+                f.write(f"- Images: {dedup_stats['total_images']} ({dedup_stats['unique_images']} unique)\n")
+                f.write(f"- Duplicates: {dedup_stats['exact_duplicates']} exact, {dedup_stats['near_duplicates']} near\n")
+                f.write(f"- Dedup Ratio: {dedup_stats['dedup_ratio']:.2f}x\n")
+                f.write(f"- Bytes Written: {format_file_size(dedup_stats['bytes_written'])}\n")
+                f.write(f"- Bytes Saved: {format_file_size(dedup_stats['bytes_saved'])}\n")
+                if dedup_stats['link_fallbacks']:
+                    f.write(f"- Hardlink Failures (copied): {dedup_stats['link_fallbacks']}\n")
+                
+            # Image encoding statistics
+            if encode_stats and encode_stats['formats']:
+                f.write("\n## Image Encoding\n")
+                options = ', '.join(f"{k}={v}" for k, v in encode_stats['options'].items())
+                f.write(f"- Options: {options}\n")
+                f.write(f"- Encode Workers: {encode_stats['workers'] or 'inline'}\n")
+                if encode_stats.get('deferred_failures'):
+                    f.write(f"- Failed After Layer Written: {encode_stats['deferred_failures']} "
+                            f"(see 'image write fail' in error.log)\n")
+                for fmt, entry in encode_stats['formats'].items():
+                    avg_ms = (entry['seconds'] / entry['count'] * 1000) if entry['count'] else 0
+                    f.write(f"- {fmt}: {entry['count']} images, {format_file_size(entry['bytes'])}, "
+                            f"{entry['seconds']:.2f} s encoding ({avg_ms:.2f} ms/image)\n")
+                
+            # Output compression statistics
+            if compression_stats:
+                f.write("\n## Output Compression\n")
+                f.write(f"- Compression: {compression_stats['compression']}\n")
+                for entry in compression_stats['files']:
+                    ratio = entry['bytes_in'] / entry['bytes_written'] if entry['bytes_written'] else 0
+                    f.write(f"- {entry['file']}: {format_file_size(entry['bytes_in'])} -> "
+                            f"{format_file_size(entry['bytes_written'])} ({ratio:.1f}x)\n")
+                
+            # Memory statistics
+            if memory_stats:
+                f.write("\n## Memory\n")
+                budget = memory_stats['max_bytes']
+                f.write(f"- Memory Budget: {format_file_size(budget) if budget else 'unlimited'}\n")
+                f.write(f"- Baseline RSS: {format_file_size(memory_stats['baseline_rss'])}\n")
+                if memory_stats.get('reserved_bytes'):
+                    f.write(f"- Reserved (shared image cache): {format_file_size(memory_stats['reserved_bytes'])}\n")
+                f.write(f"- Peak RSS: {format_file_size(memory_stats['peak_rss'])} "
+                        f"({memory_stats['rss_samples']} samples)\n")
+                f.write(f"- Final RSS: {format_file_size(memory_stats['last_rss'])}\n")
+                f.write(f"- Peak In-flight Image Bytes: {format_file_size(memory_stats['peak_in_flight_bytes'])}\n")
+                if memory_stats.get('acquire_waits'):
+                    f.write(f"- Waits For Other Jobs' Bytes: {memory_stats['acquire_waits']}\n")
+                if memory_stats['over_budget_count']:
+                    f.write(f"- Over Budget Samples: {memory_stats['over_budget_count']}\n")
+                
             # Summary chart
             f.write("\n## Visual Summary\n")
             f.write(f"- Chart File: {os.path.basename(self.summary_img_path)}\n")
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+"""
+Summary Rebuilder Module
+Regenerates summary.txt / summary.png of a print from its layers.csv and error.log,
+folding in only the 1000-layer batches added since the last rebuild
+"""
+
+import os
+import csv
+import json
+import argparse
+import logging
+
+import numpy as np
+
+from summary_generator import SummaryGenerator
+from error_handler import ErrorAggregator
+from compressed_io import find_output, compression_of, open_binary
+from utils import file_signature, iter_csv_rows
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_FILENAME = 'summary_cache.json'
+CACHE_VERSION = 2
+BATCH_SIZE = 1000
+
+
+def _to_float_array(values):
+    try:
+        return np.array(values, dtype=float)
+    except ValueError:
+        floats = []
+        for value in values:
+            try:
+                floats.append(float(value))
+            except ValueError:
+                floats.append(0.0)
+        return np.array(floats, dtype=float)
+
+
+class SummaryRebuilder:
+    """
+    Summary Rebuilder: chunked, cached aggregation of a print's output files
+    """
+
+    def __init__(self, print_dir, batch_size=BATCH_SIZE):
+        self.print_dir = print_dir
+        self.batch_size = batch_size
+        self.layers_csv_path = find_output(os.path.join(print_dir, 'layers.csv'))
+        # offsets into a compressed stream cannot be checked or seeked cheaply, it is always read in full
+        self.compressed = compression_of(self.layers_csv_path) != 'none'
+        self.error_log_path = os.path.join(print_dir, 'error.log')
+        self.cache_path = os.path.join(print_dir, CACHE_FILENAME)
+
+    def _empty_cache(self):
+        return {
+            'version': CACHE_VERSION,
+            'batch_size': self.batch_size,
+            'layers': {'header': None, 'offset': 0, 'signature': '', 'batches': []},
+            'errors': {'offset': 0, 'signature': '', 'aggregates': ErrorAggregator().to_dict()},
+        }
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return self._empty_cache()
+
+        if cache.get('version') != CACHE_VERSION or cache.get('batch_size') != self.batch_size:
+            return self._empty_cache()
+
+        # a checkpoint is only valid while the bytes before it are unchanged
+        for key, path in (('layers', self.layers_csv_path), ('errors', self.error_log_path)):
+            section = cache[key]
+            if key == 'layers' and self.compressed:
+                cache[key] = self._empty_cache()[key]
+                continue
+            valid = (os.path.exists(path) and os.path.getsize(path) >= section['offset']
+                     and file_signature(path, section['offset']) == section['signature'])
+            if not valid:
+                logger.info(f"summary cache of {os.path.basename(path)} is stale, rebuilding it")
+                cache[key] = self._empty_cache()[key]
+        return cache
+
+    def _save_cache(self, cache):
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _aggregate_batch(self, rows, columns):
+        """
+        vectorized totals of one batch of layers.csv rows
+        """
+        def column(name):
+            index = columns.get(name)
+            if index is None:
+                return np.array([''] * len(rows))
+            return np.array([row[index] if index < len(row) else '' for row in rows])
+
+        status = column('status')
+        return {
+            'rows': len(rows),
+            'height': float(_to_float_array(column('height')).sum()),
+            'errors': int(np.count_nonzero(status != 'SUCCESS')),
+            'images': int(np.count_nonzero(column('image_file') != '')),
+        }
+
+    def _update_layers(self, section):
+        if not os.path.exists(self.layers_csv_path):
+            return None
+
+        tail = []
+        with open_binary(self.layers_csv_path) as f:
+            header = f.readline()
+            if not header.endswith(b'\n'):
+                return None
+            header_row = next(csv.reader([header.decode('utf-8')]))
+            columns = {name: i for i, name in enumerate(header_row)}
+
+            if section['header'] != header_row or section['offset'] < len(header):
+                section.update(self._empty_cache()['layers'], header=header_row, offset=len(header))
+
+            if not self.compressed:
+                f.seek(section['offset'])
+            rows = []
+            for row, _, end_offset in iter_csv_rows(f, section['offset']):
+                if not row:
+                    continue
+                rows.append(row)
+                if len(rows) == self.batch_size:
+                    batch = self._aggregate_batch(rows, columns)
+                    batch['end_offset'] = end_offset
+                    section['batches'].append(batch)
+                    section['offset'] = end_offset
+                    rows = []
+
+            # the last, partial batch is recomputed every time and not cached
+            if rows:
+                tail.append(self._aggregate_batch(rows, columns))
+
+        if not self.compressed:
+            section['signature'] = file_signature(self.layers_csv_path, section['offset'])
+        return section['batches'] + tail
+
+    def _update_errors(self, section):
+        if not os.path.exists(self.error_log_path):
+            return None
+
+        aggregator = ErrorAggregator.from_dict(section['aggregates'])
+        # entries are one per line, so lines are parsed one by one
+        with open(self.error_log_path, 'rb') as f:
+            f.seek(section['offset'])
+            for raw in iter(f.readline, b''):
+                if not raw.endswith(b'\n'):
+                    break
+                section['offset'] += len(raw)
+                line = raw.decode('utf-8', errors='replace').strip()
+                # skip the comment header and column names (and the separator of older logs)
+                if not line or line.startswith(('#', '-', 'layer id', 'layer_id,')):
+                    continue
+                # older logs did not escape messages, the leading layer id and error type parse either way
+                fields = next(csv.reader([line]), [])
+                aggregator.add(fields[0] if fields else '', fields[1] if len(fields) > 1 else 'unknown')
+
+        section['aggregates'] = aggregator.to_dict()
+        section['signature'] = file_signature(self.error_log_path, section['offset'])
+        return aggregator
+
+    def aggregate(self, use_cache=True):
+        """
+        totals over all layers, reusing cached batches when possible
+        """
+        cache = self._load_cache() if use_cache else self._empty_cache()
+        cached_batches = len(cache['layers']['batches'])
+
+        batches = self._update_layers(cache['layers'])
+        if batches is None:
+            raise FileNotFoundError(f"cannot find: {self.layers_csv_path}")
+        errors = self._update_errors(cache['errors'])
+
+        self._save_cache(cache)
+
+        totals = {
+            'processed_layers': sum(b['rows'] for b in batches),
+            'total_height': sum(b['height'] for b in batches),
+            'error_layers': sum(b['errors'] for b in batches),
+            'images': sum(b['images'] for b in batches),
+            'error_count': None,
+            'error_stats': None,
+            'batches': len(batches),
+            'cached_batches': cached_batches,
+        }
+        # error.log also holds processing failures, fall back to layer status without it
+        if errors is not None:
+            totals['error_count'] = errors.entries
+            totals['error_stats'] = errors.get_stats()
+        else:
+            totals['error_count'] = totals['error_layers']
+        return totals
+
+    def rebuild(self, use_cache=True):
+        totals = self.aggregate(use_cache)
+        logger.info(f"summarize: {totals['processed_layers']} layers in {totals['batches']} batches "
+                    f"({totals['cached_batches']} from cache)")
+
+        summary_generator = SummaryGenerator(self.print_dir)
+        # elapsed time and the dedup / encoding / memory / clock / compression sections come from the run
+        run_stats = summary_generator.load_run_stats()
+        if not run_stats:
+            logger.info(f"no run stats in {self.print_dir}, the summary only covers the output files")
+        run_stats = dict({'elapsed_time': None, 'terminated_early': False}, **run_stats)
+
+        return summary_generator.generate(
+            processed_layers=totals['processed_layers'],
+            total_height=totals['total_height'],
+            error_count=totals['error_count'],
+            error_stats=totals['error_stats'],
+            **run_stats
+        )
+
+
+def run_summarize(argv=None):
+    """
+    entry point of `main.py summarize <print_dir>`
+    """
+    parser = argparse.ArgumentParser(prog='main.py summarize',
+                                     description='FakePrinter - rebuild the summary of a print from its outputs')
+    parser.add_argument('print_dir', type=str, help='Print output directory (<output_folder>/<print_name>)')
+    parser.add_argument('--full', action='store_true',
+                        help='Ignore the cached batch aggregates and re-read everything')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.print_dir):
+        parser.error(f"Print directory '{args.print_dir}' does not exist")
+
+    try:
+        success = SummaryRebuilder(args.print_dir).rebuild(use_cache=not args.full)
+    except Exception as e:
+        logger.error(f"summarize error: {e}")
+        return 1
+    return 0 if success else 1
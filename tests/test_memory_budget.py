@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""
+Peak RSS of a synthetic 2M-layer print stays flat, in-flight image bytes stay within the budget
+"""
+
+import os
+import io
+import sys
+import shutil
+import argparse
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_processor import ImageProcessor
+from memory_budget import MemoryBudget, current_rss
+from print_job import add_output_arguments, create_job, run_automatic_mode
+
+
+# FAKEPRINTER_TEST_LAYERS shortens the run while iterating locally
+LAYERS = int(os.environ.get('FAKEPRINTER_TEST_LAYERS', 2000000))
+SAMPLE_EVERY = max(1, LAYERS // 40)
+# growth allowed after warm-up, well below what keeping per-layer data would take
+MAX_GROWTH = 16 * 1024 * 1024
+
+IMAGE_SIZE = (32, 32)
+# decoded RGB bytes of one layer image, as estimate_image_bytes counts them
+IMAGE_BYTES = IMAGE_SIZE[0] * IMAGE_SIZE[1] * 3
+
+
+def write_print_csv(path, layers):
+    """
+    every 10th layer without an image url, every 500th one failed
+    """
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('Layer Error,Layer Number,Layer Height,Layer Time,file_name,image url\n')
+        for layer in range(1, layers + 1):
+            status = '"Overheat, severe"' if layer % 500 == 0 else 'SUCCESS'
+            url = '' if layer % 10 == 0 else f"http://images.test/{layer % 50}.png"
+            f.write(f"{status},{layer},0.2,5min_12sec,l{layer}.png,{url}\n")
+
+
+def image_layers(layers):
+    return layers - layers // 10
+
+
+@pytest.fixture
+def fake_downloads(monkeypatch):
+    """
+    serve the same small PNG for every image url
+    """
+    buffer = io.BytesIO()
+    Image.new('RGB', IMAGE_SIZE, (200, 80, 30)).save(buffer, format='PNG')
+    content = buffer.getvalue()
+    monkeypatch.setattr(ImageProcessor, 'fetch_image_bytes', staticmethod(lambda url, *args, **kwargs: content))
+
+
+@pytest.fixture
+def print_dir(tmp_path):
+    """
+    tmp_path, emptied afterwards: a full-size run leaves almost two million image files
+    """
+    yield tmp_path
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+class RssSamplingParser:
+    """
+    passes the layers through and samples RSS every SAMPLE_EVERY layers
+    """
+
+    def __init__(self, data_parser):
+        self.data_parser = data_parser
+        self.samples = []
+
+    def get_estimated_total_layers(self):
+        return self.data_parser.get_estimated_total_layers()
+
+    def parse(self):
+        for row_index, layer_data in enumerate(self.data_parser.parse()):
+            if row_index % SAMPLE_EVERY == 0:
+                self.samples.append(current_rss())
+            yield layer_data
+
+
+def create_print(print_dir, layers, argv, memory_budget=None):
+    """
+    output objects of a synthetic print, (data parser, output manager, error handler, summary generator)
+    """
+    data_file = str(print_dir / 'print.csv')
+    write_print_csv(data_file, layers)
+
+    parser = argparse.ArgumentParser()
+    add_output_arguments(parser)
+    args = parser.parse_args(argv)
+
+    return create_job('flat', str(print_dir / 'out'), data_file, args, memory_budget=memory_budget)[1:]
+
+
+def run_print(data_parser, output_manager, error_handler, summary_generator):
+    """
+    run in automatic mode, returns the RSS samples
+    """
+    sampling_parser = RssSamplingParser(data_parser)
+    assert run_automatic_mode(sampling_parser, output_manager, error_handler, summary_generator)
+    return sampling_parser.samples
+
+
+def encoded_images(output_manager):
+    return output_manager.get_encode_stats()['formats']['png']['count']
+
+
+def test_rss_flat_over_2m_layers(print_dir, fake_downloads):
+    job = create_print(print_dir, LAYERS, ['--max-memory', '256M', '--encode-workers', '2'])
+    samples = run_print(*job)
+    _, output_manager, error_handler, _ = job
+
+    assert output_manager.get_layers_written() == LAYERS
+    assert encoded_images(output_manager) == image_layers(LAYERS)
+    assert error_handler.get_error_count() == LAYERS // 500
+
+    # the first tenth warms up caches and allocator arenas, after that RSS must not climb
+    warm = samples[min(len(samples) - 1, max(1, len(samples) // 10))]
+    assert max(samples) - warm < MAX_GROWTH, samples
+
+    stats = output_manager.get_memory_stats()
+    assert stats['rss_samples'] >= LAYERS // 100
+    assert stats['peak_rss'] - warm < MAX_GROWTH
+    assert stats['over_budget_count'] == 0
+    assert 0 < stats['peak_in_flight_bytes'] <= output_manager.memory_budget.in_flight_limit
+
+
+def test_backpressure_keeps_in_flight_bytes_within_budget(print_dir, fake_downloads):
+    # room for three decoded images, while the encode queue alone would hold eight
+    memory_budget = MemoryBudget(512 * 1024 * 1024)
+    memory_budget.reserve(memory_budget.in_flight_limit - 3 * IMAGE_BYTES, 'test')
+    job = create_print(print_dir, 2000, ['--encode-workers', '4'], memory_budget=memory_budget)
+    run_print(*job)
+    _, output_manager, error_handler, _ = job
+
+    assert output_manager.max_pending_images * IMAGE_BYTES > memory_budget.in_flight_limit
+    assert encoded_images(output_manager) == image_layers(2000)
+    assert error_handler.get_error_count() == 2000 // 500
+
+    stats = output_manager.get_memory_stats()
+    assert IMAGE_BYTES < stats['peak_in_flight_bytes'] <= 3 * IMAGE_BYTES
+    assert stats['over_budget_count'] == 0
+    assert memory_budget.in_flight_bytes == 0
+
+
+def test_over_budget_rss_flushes_pending_images(print_dir, fake_downloads, monkeypatch):
+    # any RSS is over a one-byte budget, so every sample forces a flush
+    memory_budget = MemoryBudget(1)
+    job = create_print(print_dir, 2000, ['--encode-workers', '2'], memory_budget=memory_budget)
+    _, output_manager, error_handler, _ = job
+
+    # pending images left behind by each flush
+    flushes = []
+    flush_images = output_manager.flush_images
+
+    def counting_flush():
+        flush_images()
+        flushes.append(len(output_manager._pending_images))
+    monkeypatch.setattr(output_manager, 'flush_images', counting_flush)
+    run_print(*job)
+
+    stats = output_manager.get_memory_stats()
+    assert stats['over_budget_count'] == stats['rss_samples'] >= 2000 // 100
+    # one flush per over-budget sample during the run and one on close, which samples once more
+    assert len(flushes) == stats['over_budget_count'] and not any(flushes)
+    assert encoded_images(output_manager) == image_layers(2000)
+    assert error_handler.get_error_count() == 2000 // 500
@@ -7,6 +7,8 @@
 """
 
 import os
+import csv
+import hashlib
 import logging
 import time
 from pathlib import Path
@@ -98,6 +100,75 @@ def get_file_info(file_path):
         return None
         
         
+def parse_size(size_str):
+    """
+    将可读大小字符串解析为字节数
+    
+    Args:
+        size_str: 大小字符串，例如 "512M"、"2G"，不带单位时按 MB 计算
+        
+    Returns:
+        int: 字节数
+    """
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    text = str(size_str).strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text) * units['M'])
+        
+        
+def file_signature(file_path, offset, window=4096):
+    """
+    计算文件指定偏移量之前若干字节的哈希，用于判断文件是否被重写
+    
+    Args:
+        file_path: 文件路径
+        offset: 字节偏移量
+        window: 参与哈希的字节数
+        
+    Returns:
+        str: 十六进制哈希值，偏移量为 0 时返回空字符串
+    """
+    if offset <= 0:
+        return ''
+    with open(file_path, 'rb') as f:
+        start = max(offset - window, 0)
+        f.seek(start)
+        return hashlib.sha1(f.read(offset - start)).hexdigest()
+        
+        
+def iter_csv_rows(f, offset):
+    """
+    从二进制文件当前位置逐条读取 CSV 记录及其字节范围，带引号的字段可以跨行，
+    末尾尚未写完的记录（没有换行或引号未闭合）不返回
+    
+    Args:
+        f: 以二进制模式打开并已定位到 offset 的文件
+        offset: 当前位置的字节偏移量
+        
+    Yields:
+        tuple: (row, start, end) 记录内容及其起止字节偏移量
+    """
+    # [当前字节偏移量, 是否已读到文件末尾]
+    state = [offset, False]
+    
+    def lines():
+        for raw in iter(f.readline, b''):
+            if not raw.endswith(b'\n'):
+                break
+            state[0] += len(raw)
+            yield raw.decode('utf-8')
+        state[1] = True
+    
+    start = offset
+    for row in csv.reader(lines()):
+        # 读到末尾后才凑成的记录是引号未闭合的半条记录
+        if state[1]:
+            return
+        yield row, start, state[0]
+        start = state[0]
+        
+        
 def safe_filename(filename):
     """
     生成安全的文件名，移除非法字符